@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of synchronization against local fake services.
+
+For each dataset size, a fake OpenProject project is seeded with synthetic
+work packages, an empty fake calendar is created, and `main.main` is run in
+three scenarios on the same state:
+    initial: the calendar is empty, every work package is created
+    unchanged: nothing has changed since the initial run
+    changed: one percent of the work packages have changed
+Each run reports its wall time, requests and transferred bytes per API and
+the peak of traced memory. The same numbers are reported for each phase:
+    setup: credentials, sessions and services
+    read: reading work packages and events
+    parse: parsing work packages and events
+    diff: classifying work packages and building calendar calls
+    mutate: executing calendar calls
+    log: saving logs locally and to the sheet
+Time, requests and bytes of a phase exclude the phases nested in it, e.g. the
+read of a work package page that is triggered while parsing is counted in
+read. Peak memory of a phase is the highest traced memory while it is the
+innermost phase, phases of different threads are not told apart. Tracing
+memory slows down runs, use `--no-memory` for timings closer to reality.
+
+Usage:
+    python3 benchmarks/end_to_end.py --sizes 100 1000 10000 > end_to_end.json
+    python3 benchmarks/end_to_end.py --sizes 100000 --latency 0.05 --rate-limit 10
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+from collections import Counter
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import main  # noqa: E402
+import synchronization as sync  # noqa: E402
+from benchmarks.fake_services import FakeServices  # noqa: E402
+from log_sink import LogSink  # noqa: E402
+
+PROJECT_ID = 1
+PROJECT_NAME = 'Benchmark'
+CALENDAR_ID = 'benchmark@group.calendar.google.com'
+SHEET_ID = 'benchmark-sheet'
+# Minimal discovery documents of Calendar and Sheets APIs
+DISCOVERY_DIR = os.path.join(REPOSITORY, 'benchmarks', 'discovery')
+SCOPES = ['https://www.googleapis.com/auth/calendar',
+          'https://www.googleapis.com/auth/spreadsheets']
+# Functions measured as phases, their module or class and names
+PHASES = {
+    'setup': [(sync, 'load_credentials'), (sync, 'openproject_session'),
+              (sync, 'google_calendar_service'), (sync, 'google_sheet_service')],
+    'read': [(sync, 'get_projects_and_ids'), (sync, 'read_workpackages'),
+             (sync, 'read_changed_workpackages'), (sync, 'read_events'),
+             (sync, 'read_indexed_events')],
+    'parse': [(sync, 'parse_workpackages'), (sync, 'parse_events')],
+    'diff': [(sync, 'synchronize_wps')],
+    'mutate': [(sync, 'execute_operation'), (sync, 'execute_in_batches'),
+               (sync, 'execute_concurrently')],
+    'log': [(sync, 'save_logs'), (LogSink, 'write'), (LogSink, 'flush')],
+}
+
+
+class PhaseRecorder:
+    """Records exclusive time, requests, bytes and peak memory of phases.
+
+    Args:
+        services: FakeServices whose counters are attributed to phases
+        trace_memory: whether peak memory of phases is recorded
+    """
+
+    def __init__(self, services, trace_memory):
+        self.services = services
+        self.trace_memory = trace_memory
+        self.totals = {}
+        self.peak_memory = 0  # Of all phases and outside of them
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _snapshot(self):
+        requests, transferred = self.services.counters()
+        return time.perf_counter(), requests, transferred
+
+    def _record_memory(self, stack):
+        """Attributes the peak since the last phase boundary to the top phase"""
+        if not self.trace_memory:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+        self.peak_memory = max(self.peak_memory, peak)
+        if stack:
+            total = self._total(stack[-1]['phase'])
+            total['peak_memory'] = max(total['peak_memory'], peak)
+
+    def _total(self, phase):
+        return self.totals.setdefault(phase, {
+            'seconds': 0.0, 'calls': 0, 'requests': Counter(), 'bytes': Counter(),
+            'peak_memory': 0})
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context of a phase, nested phases are subtracted from it"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        with self._lock:
+            self._record_memory(stack)
+        stack.append({'phase': name, 'start': self._snapshot(),
+                      'nested': (0.0, Counter(), Counter())})
+        try:
+            yield
+        finally:
+            end = self._snapshot()
+            with self._lock:
+                self._record_memory(stack)
+                frame = stack.pop()
+                inclusive = [end[0] - frame['start'][0], end[1] - frame['start'][1],
+                             end[2] - frame['start'][2]]
+                total = self._total(name)
+                total['calls'] += 1
+                total['seconds'] += inclusive[0] - frame['nested'][0]
+                total['requests'].update(inclusive[1] - frame['nested'][1])
+                total['bytes'].update(inclusive[2] - frame['nested'][2])
+                if stack:
+                    nested = stack[-1]['nested']
+                    stack[-1]['nested'] = (nested[0] + inclusive[0],
+                                           nested[1] + inclusive[1],
+                                           nested[2] + inclusive[2])
+
+    def wrap(self, function, name):
+        """Returns the function measured as the phase, generators included"""
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            with self.phase(name):
+                result = function(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(result, name)
+            return result
+
+        return measured
+
+    def _iterate(self, generator, name):
+        """Measures each step of a generator as the phase"""
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        return {phase: {'seconds': round(total['seconds'], 6),
+                        'calls': total['calls'],
+                        'requests': dict(total['requests']),
+                        'bytes': dict(total['bytes']),
+                        'peak_memory': total['peak_memory']}
+                for phase, total in sorted(self.totals.items())}
+
+
+@contextlib.contextmanager
+def instrumented(recorder):
+    """Replaces the functions of PHASES with measured ones temporarily"""
+    originals = []
+    for phase, functions in PHASES.items():
+        for owner, name in functions:
+            function = getattr(owner, name)
+            originals.append((owner, name, function))
+            setattr(owner, name, recorder.wrap(function, phase))
+    try:
+        yield
+    finally:
+        for owner, name, function in originals:
+            setattr(owner, name, function)
+
+
+def service_account_file(directory, token_uri):
+    """Writes a service account secret file with a new key, returns its path"""
+    try:  # google-auth signs with cryptography if it is installed
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        private_key = rsa.generate_private_key(65537, 2048).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption())
+    except ImportError:  # otherwise with rsa, a dependency of google-auth
+        import rsa
+
+        private_key = rsa.newkeys(1024)[1].save_pkcs1()
+    path = os.path.join(directory, 'service_account.json')
+    with open(path, 'w', encoding='utf-8') as secret_file:
+        json.dump({'type': 'service_account', 'project_id': 'benchmark',
+                   'private_key_id': 'benchmark',
+                   'private_key': private_key.decode('ascii'),
+                   'client_email': 'benchmark@benchmark.iam.gserviceaccount.com',
+                   'client_id': '1', 'token_uri': token_uri}, secret_file)
+
+    return path
+
+
+def discovery_cache(directory, root_url):
+    """Caches discovery documents that point Google services to root_url.
+
+    The documents are the minimal ones in `benchmarks/discovery`, which
+    describe only the methods used by the synchronization, thus the
+    benchmark never downloads them from Google.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for api, version in (('calendar', 'v3'), ('sheets', 'v4')):
+        with open(os.path.join(DISCOVERY_DIR, '{}.{}.json'.format(api, version)),
+                  encoding='utf-8') as document_file:
+            document = json.load(document_file)
+        document['rootUrl'] = document['mtlsRootUrl'] = root_url
+        document['baseUrl'] = root_url + document['servicePath']
+        with open(os.path.join(directory, '{}.{}.v{}.json'.format(
+                api, version, sync.DISCOVERY_CACHE_VERSION)), 'w',
+                  encoding='utf-8') as cache_file:
+            json.dump(document, cache_file)
+
+
+def benchmark(size, args):
+    """Runs the scenarios on a dataset of `size` work packages"""
+    services = FakeServices(args.latency, args.page_size, args.page_size,
+                            args.rate_limit).start()
+    services.add_project(PROJECT_ID, PROJECT_NAME)
+    services.seed_work_packages(PROJECT_ID, size)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        discovery_cache(os.path.join(directory, 'discovery'), services.url)
+        parameters = {
+            'path_to_secret_file': service_account_file(directory,
+                                                        services.url + 'token'),
+            'SCOPES': SCOPES,
+            'calendar_id': CALENDAR_ID,
+            'openproject_api_url': services.url + 'api/v3/',
+            'openproject_api_key': 'benchmark',
+            'project_name': PROJECT_NAME,
+            'save_logs': True,
+            'sheet_id': SHEET_ID,
+            'state_file': None if args.no_state
+                          else os.path.join(directory, 'state.sqlite3'),
+            'batch_size': args.batch_size,
+            'max_workers': args.max_workers,
+            'requests_per_second': args.requests_per_second,
+            'max_retries': args.max_retries,
+            'use_event_index': not args.no_state,
+            'select_fields': not args.no_select,
+            'discovery_cache_dir': os.path.join(directory, 'discovery'),
+            'log_dir': os.path.join(directory, 'logs'),
+            'openproject_cache_file': os.path.join(directory, 'openproject.sqlite3')
+                                      if args.openproject_cache else None,
+        }
+        if args.window_days:
+            parameters.update(window_past_days=args.window_days[0],
+                              window_future_days=args.window_days[1],
+                              window_shard_days=args.window_shard_days)
+        for scenario in ('initial', 'unchanged', 'changed'):
+            if scenario == 'changed':
+                services.touch_work_packages(PROJECT_ID, 0.01)
+            results.append(dict({'size': size, 'scenario': scenario},
+                                **run(parameters, services, args.memory)))
+    services.stop()
+
+    return results
+
+
+def run(parameters, services, trace_memory):
+    """Runs main.main once and returns its measurements"""
+    recorder = PhaseRecorder(services, trace_memory)
+    requests, transferred = services.counters()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with instrumented(recorder), contextlib.redirect_stdout(io.StringIO()):
+        main.main(parameters)
+    wall = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = max(recorder.peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    end_requests, end_transferred = services.counters()
+
+    return {'wall_seconds': round(wall, 6),
+            'requests': dict(end_requests - requests),
+            'bytes': dict(end_transferred - transferred),
+            'peak_memory': peak,
+            'events': sum(event['status'] != 'cancelled' for event in
+                          services.calendars.get(CALENDAR_ID, {}).values()),
+            'phases': recorder.report()}
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='numbers of work packages of the datasets')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the fake services wait before each answer')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='maximum page size of the fake services')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='calendar calls per second the fake calendar allows')
+    parser.add_argument('--requests-per-second', type=float, default=None,
+                        help='requests_per_second parameter of the synchronization')
+    parser.add_argument('--batch-size', type=int, default=50,
+                        help='batch_size parameter of the synchronization')
+    parser.add_argument('--max-workers', type=int, default=4,
+                        help='max_workers parameter of the synchronization')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='max_retries parameter of the synchronization')
+    parser.add_argument('--no-state', action='store_true',
+                        help='synchronize without a state file')
+    parser.add_argument('--no-select', action='store_true',
+                        help='request all fields of work packages')
+    parser.add_argument('--openproject-cache', action='store_true',
+                        help='revalidate cached OpenProject responses with ETags')
+    parser.add_argument('--window-days', type=int, nargs=2, default=None,
+                        metavar=('PAST', 'FUTURE'),
+                        help='synchronize only the window of these days around today')
+    parser.add_argument('--window-shard-days', type=int, default=90,
+                        help='window_shard_days parameter of the synchronization')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not trace memory')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        results.extend(benchmark(size, args))
+    print(json.dumps({'parameters': vars(args), 'results': results}, indent=2))
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins of OpenProject, Google Calendar and Google Sheets APIs.
+
+FakeServices serves the parts of the APIs that the synchronization uses from
+a single local HTTP server, so that the synchronization can be measured
+without live services:
+    /token: OAuth 2.0 token endpoint of the service account
+    /api/v3/: projects and work packages of OpenProject, with pagination and
+        the `status`, `updatedAt`, `dueDate`, `createdAt` and `id` filters,
+        sorted by id if it is asked.
+        Responses are tagged with an `ETag`, and `If-None-Match` is answered
+        with `304 Not Modified` if they have not changed.
+    /calendar/v3/: listing (with page and sync tokens), insertion, update,
+        patch and deletion of events, and batch requests of them
+    /v4/spreadsheets/: appending logs to the pages of a sheet and reading
+        their first columns
+Changes of work packages can also be sent to webhook receivers as OpenProject
+does, see FakeServices.subscribe(). Latency of each request, maximum page
+sizes and the rate limit of Calendar API are configurable. Requests and
+transferred bytes are counted per API.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+STATUS_TEXTS = {200: 'OK', 204: 'No Content', 304: 'Not Modified',
+                400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+                409: 'Conflict', 410: 'Gone'}
+# OpenProject lists open work packages unless other filters are given
+OPEN = json.dumps([{'status': {'operator': 'o', 'values': []}}])
+
+
+class FakeServices:
+    """Fake OpenProject, Calendar and Sheets APIs served on localhost.
+
+    Args:
+        latency: seconds waited before answering each HTTP request
+        max_page_size: maximum `pageSize` of OpenProject collections
+        max_results: maximum number of events on a page of Calendar listing
+        rate_limit: allowed Calendar calls per second, calls beyond it are
+            answered with 403 `rateLimitExceeded`. No limit if None.
+    """
+
+    def __init__(self, latency=0.0, max_page_size=1000, max_results=250,
+                 rate_limit=None):
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.max_results = max_results
+        self.rate_limit = rate_limit
+        self.projects = {}
+        self.work_packages = {}  # project_id: {wp_id: work package}
+        self.calendars = {}  # calendar_id: {event_id: event}
+        self.changes = {}  # calendar_id: [(sequence, event_id)]
+        self.sheets = {}  # spreadsheet_id: [page properties and rows]
+        self.webhooks = []  # (url, secret) of webhook receivers
+        self.requests = Counter()
+        self.bytes = Counter()
+        self._sequence = 0
+        self._allowance = rate_limit
+        self._last_call = time.monotonic()
+        self._lock = threading.RLock()
+        self._server = None
+
+    # Server
+
+    def start(self):
+        """Starts serving on a free port in a background thread"""
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive
+
+            def handle_any(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                status, headers, content = services.handle(
+                    self.command, self.path, dict(self.headers.items()), body)
+                if 'gzip' in self.headers.get('Accept-Encoding', '') and \
+                        len(content) > 1024 and status != 204:
+                    content = gzip.compress(content)
+                    headers['Content-Encoding'] = 'gzip'
+                services.count(self.path, len(body) + len(content))
+                self.send_response(status, STATUS_TEXTS.get(status))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+            def log_message(self, *args):  # Quiet
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        return self
+
+    def stop(self):
+        """Stops serving"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def url(self):
+        """Root url of the server, e.g. 'http://127.0.0.1:8080/'"""
+        return 'http://127.0.0.1:{}/'.format(self._server.server_address[1])
+
+    def count(self, path, size):
+        """Counts a request and its transferred bytes for its API"""
+        api = api_of(path)
+        with self._lock:
+            self.requests[api] += 1
+            self.bytes[api] += size
+
+    def counters(self):
+        """Returns copies of request and byte counters"""
+        with self._lock:
+            return Counter(self.requests), Counter(self.bytes)
+
+    def handle(self, method, path, headers, body):
+        """Answers a request, returns status, headers and content"""
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/token':
+                return json_response(200, {'access_token': uuid.uuid4().hex,
+                                           'expires_in': 3600,
+                                           'token_type': 'Bearer'})
+            if url.path.startswith('/api/v3/'):
+                return conditional(headers, *self.openproject(
+                    method, url.path[len('/api/v3/'):], query))
+            if url.path.startswith('/batch/calendar/v3'):
+                return self.batch(headers, body)
+            if url.path.startswith('/calendar/v3/'):
+                return self.calendar(method, url.path[len('/calendar/v3/'):],
+                                     query, body)
+            if url.path.startswith('/v4/spreadsheets/'):
+                return self.spreadsheets(method, url.path[len('/v4/spreadsheets/'):],
+                                         body, parse_qs(url.query).get('ranges', []))
+        except KeyError as error:
+            return error_response(404, 'notFound', repr(error))
+
+        return error_response(404, 'notFound', path)
+
+    # Data
+
+    def add_project(self, project_id, name):
+        """Adds an empty project to OpenProject"""
+        self.projects[project_id] = {'_type': 'Project', 'id': project_id,
+                                     'name': name}
+        self.work_packages[project_id] = {}
+
+    def seed_work_packages(self, project_id, count, seed=0):
+        """Adds `count` synthetic open work packages to the project.
+
+        Due dates are spread over a year around today, a tenth of the work
+        packages do not have a due date, and some have parents and assignees.
+        """
+        generator = random.Random(seed)
+        today = datetime.now(timezone.utc).replace(microsecond=0)
+        assignees = ['Member {}'.format(number) for number in range(30)]
+        for wp_id in range(1, count + 1):
+            created = today - timedelta(days=generator.randint(1, 400))
+            due = today + timedelta(days=generator.randint(-180, 180))
+            hour = '{:02d}:{:02d}:00'.format(generator.randint(8, 18),
+                                             generator.choice([0, 15, 30, 45]))
+            text = 'Synthetic work package {}'.format(wp_id)
+            parent = generator.randint(1, wp_id - 1) if wp_id > 1 and \
+                generator.random() < 0.3 else None
+            assignee = generator.randrange(len(assignees)) \
+                if generator.random() < 0.8 else None
+            self.work_packages[project_id][wp_id] = {
+                '_type': 'WorkPackage', 'id': wp_id,
+                'subject': 'Task {}'.format(wp_id),
+                'description': {'format': 'markdown',
+                                'raw': '{}\ndueHour={}'.format(text, hour),
+                                'html': '<p>{}<br>dueHour={}</p>'.format(text, hour)},
+                'dueDate': None if wp_id % 10 == 0 else due.date().isoformat(),
+                'createdAt': iso(created),
+                'updatedAt': iso(created + timedelta(hours=1)),
+                'status': 'open',
+                'priority': 'Normal',
+                '_links': {
+                    'self': {'href': '/api/v3/work_packages/{}'.format(wp_id)},
+                    'project': {'href': '/api/v3/projects/{}'.format(project_id)},
+                    'parent': {'href': '/api/v3/work_packages/{}'.format(parent)
+                                       if parent else None,
+                               'title': 'Task {}'.format(parent) if parent else None},
+                    'assignee': {'href': '/api/v3/users/{}'.format(assignee)
+                                         if assignee is not None else None,
+                                 'title': assignees[assignee]
+                                          if assignee is not None else None},
+                    'status': {'href': '/api/v3/statuses/1', 'title': 'New'}}}
+            # Other properties and links of a work package, never parsed
+            elem = self.work_packages[project_id][wp_id]
+            elem.update({'lockVersion': 3, 'percentageDone': 0, 'startDate': None,
+                         'estimatedTime': None, 'derivedEstimatedTime': None,
+                         'spentTime': 'PT0S', 'scheduleManually': False,
+                         'position': wp_id, 'storyPoints': None,
+                         'remainingTime': None, 'readonly': False})
+            for link in ('author', 'responsible', 'type', 'priority', 'version',
+                         'category', 'attachments', 'watchers', 'activities',
+                         'relations', 'revisions', 'schema', 'update',
+                         'updateImmediately', 'delete', 'logTime', 'move', 'copy',
+                         'pdf', 'atom', 'availableRelationCandidates',
+                         'customFields', 'configureForm', 'ancestors'):
+                elem['_links'][link] = {'href': '/api/v3/work_packages/{}/{}'.format(
+                    wp_id, link), 'title': link.capitalize(), 'method': 'get'}
+
+    def touch_work_packages(self, project_id, fraction, seed=1):
+        """Changes subjects of a fraction of the work packages of the project"""
+        generator = random.Random(seed)
+        work_packages = list(self.work_packages[project_id].values())
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        for elem in generator.sample(work_packages, int(len(work_packages) * fraction)):
+            elem['subject'] += ' (changed)'
+            elem['updatedAt'] = iso(now)
+            self.notify('work_package:updated', elem)
+
+    def change_work_package(self, project_id, wp_id, **changes):
+        """Changes properties of a work package, e.g. `subject` or `status`"""
+        elem = self.work_packages[project_id][wp_id]
+        elem.update(changes)
+        elem['updatedAt'] = iso(datetime.now(timezone.utc).replace(microsecond=0))
+        self.notify('work_package:updated', elem)
+
+    # Webhooks
+
+    def subscribe(self, url, secret=None):
+        """Sends webhooks of changed work packages to `url` from now on"""
+        self.webhooks.append((url, secret))
+
+    def notify(self, action, elem):
+        """Sends the webhook of a work package to the receivers"""
+        for url, secret in self.webhooks:
+            send_webhook(url, action, elem, secret)
+
+    # OpenProject
+
+    def openproject(self, method, path, query):
+        if path.rstrip('/') == 'projects':
+            elements = list(self.projects.values())
+            return json_response(200, collection(elements, len(elements), 1,
+                                                 len(elements), '/api/v3/projects'))
+        match = re.fullmatch(r'projects/(\d+)/work_packages', path)
+        if match:
+            project_id = int(match.group(1))
+            elements = [elem for elem in self.work_packages[project_id].values()
+                        if matches_filters(elem, json.loads(query.get('filters', OPEN)))]
+            if query.get('sortBy') == '[["id", "asc"]]':
+                elements.sort(key=lambda elem: elem['id'])
+            offset = int(query.get('offset', 1))
+            page_size = min(int(query.get('pageSize', 20)), self.max_page_size)
+            page = elements[(offset - 1) * page_size:offset * page_size]
+            if 'select' in query:
+                page = [select_fields(elem, query['select']) for elem in page]
+            self_url = '/api/v3/projects/{}/work_packages'.format(project_id)
+            return json_response(200, collection(page, len(elements), offset,
+                                                 page_size, self_url, query))
+        match = re.fullmatch(r'work_packages/(\d+)', path)
+        if match:
+            wp_id = int(match.group(1))
+            for work_packages in self.work_packages.values():
+                if wp_id in work_packages:
+                    return json_response(200, work_packages[wp_id])
+        return error_response(404, 'notFound', path)
+
+    # Calendar
+
+    def calendar(self, method, path, query, body):
+        match = re.fullmatch(r'calendars/([^/]+)/events(?:/([^/]+))?', path)
+        if not match:
+            return error_response(404, 'notFound', path)
+        if not self.allow_call():
+            return error_response(403, 'rateLimitExceeded', 'Rate Limit Exceeded')
+        calendar_id, event_id = unquote(match.group(1)), match.group(2)
+        with self._lock:
+            events = self.calendars.setdefault(calendar_id, {})
+            if event_id is None and method == 'GET':
+                return self.list_events(calendar_id, events, query)
+            if event_id is None and method == 'POST':
+                event = json.loads(body.decode('utf-8'))
+                event_id = event.get('id') or uuid.uuid4().hex
+                if event_id in events:
+                    return error_response(409, 'duplicate',
+                                          'The requested identifier already exists.')
+                return self.save_event(calendar_id, dict(event, id=event_id),
+                                       query.get('fields'))
+            if event_id not in events:
+                return error_response(404, 'notFound', 'Not Found')
+            event = events[event_id]
+            if method == 'GET':
+                return json_response(200, partial_response(event, query.get('fields')))
+            if method == 'DELETE':
+                if event['status'] == 'cancelled':
+                    return error_response(410, 'deleted', 'Resource has been deleted')
+                self.save_event(calendar_id, {'id': event_id, 'status': 'cancelled',
+                                              'extendedProperties':
+                                                  event.get('extendedProperties')})
+                return 204, {}, b''
+            changes = json.loads(body.decode('utf-8'))
+            if method == 'PUT':
+                return self.save_event(calendar_id, dict(changes, id=event_id),
+                                       query.get('fields'))
+            if method == 'PATCH':
+                return self.save_event(calendar_id, dict(event, **changes),
+                                       query.get('fields'))
+        return error_response(400, 'badRequest', method)
+
+    def save_event(self, calendar_id, event, fields=None):
+        """Saves an event and records the change for sync tokens"""
+        self._sequence += 1
+        now = iso(datetime.now(timezone.utc))
+        event.setdefault('status', 'confirmed')
+        # Fields that Google adds to each event
+        event.update({'kind': 'calendar#event', 'etag': '"{}"'.format(self._sequence),
+                      'htmlLink': 'https://calendar.example/event?eid=' + event['id'],
+                      'updated': now, 'iCalUID': event['id'] + '@google.com',
+                      'sequence': 0, 'eventType': 'default',
+                      'creator': {'email': 'benchmark@benchmark.iam.gserviceaccount.com'},
+                      'organizer': {'email': calendar_id, 'self': True}})
+        event.setdefault('created', now)
+        self.calendars[calendar_id][event['id']] = event
+        self.changes.setdefault(calendar_id, []).append((self._sequence, event['id']))
+        return json_response(200, partial_response(event, fields))
+
+    def list_events(self, calendar_id, events, query):
+        if 'syncToken' in query:
+            since = int(query['syncToken'])
+            changed = {event_id for sequence, event_id
+                       in self.changes.get(calendar_id, []) if sequence > since}
+            items = [events[event_id] for event_id in sorted(changed)]
+        else:
+            items = [event for event in events.values()
+                     if event['status'] != 'cancelled' and in_window(event, query)]
+        if 'privateExtendedProperty' in query:
+            key, _, value = query['privateExtendedProperty'].partition('=')
+            items = [event for event in items if
+                     (event.get('extendedProperties') or {}).get('private', {})
+                     .get(key) == value]
+        start = int(query.get('pageToken') or 0)
+        page_size = min(int(query.get('maxResults', 250)), self.max_results)
+        result = {'kind': 'calendar#events', 'items': items[start:start + page_size]}
+        if start + page_size < len(items):
+            result['nextPageToken'] = str(start + page_size)
+        else:
+            result['nextSyncToken'] = str(self._sequence)
+        return json_response(200, partial_response(result, query.get('fields')))
+
+    def batch(self, headers, body):
+        """Answers each request of a multipart/mixed batch request"""
+        boundary = re.search(r'boundary="?([^";]+)"?', headers.get('Content-Type', '')
+                             or headers.get('content-type', '')).group(1)
+        parts = body.decode('utf-8').split('--' + boundary)
+        answers = []
+        for part in parts[1:]:
+            if part.startswith('--'):  # Closing boundary
+                break
+            # Headers of the part, then the request line, its headers and body
+            sections = re.split(r'\r?\n\r?\n', part.strip('\r\n'), 2) + ['']
+            part_headers, request, request_body = sections[:3]
+            content_id = re.search(r'Content-ID: <([^>]+)>', part_headers, re.I).group(1)
+            method, path = request.split()[:2]
+            status, _, content = self.calendar(
+                method, urlsplit(path).path[len('/calendar/v3/'):],
+                {key: values[-1] for key, values in
+                 parse_qs(urlsplit(path).query).items()},
+                request_body.strip().encode('utf-8'))
+            answers.append('Content-Type: application/http\r\n'
+                           'Content-ID: <response-{}>\r\n\r\n'
+                           'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n\r\n'
+                           '{}\r\n'.format(content_id, status, STATUS_TEXTS.get(status, ''),
+                                           content.decode('utf-8')))
+        answer_boundary = 'batch_' + uuid.uuid4().hex
+        content = ''.join('--{}\r\n{}'.format(answer_boundary, answer)
+                          for answer in answers) + '--{}--'.format(answer_boundary)
+        return 200, {'Content-Type': 'multipart/mixed; boundary=' + answer_boundary}, \
+            content.encode('utf-8')
+
+    def allow_call(self):
+        """Token bucket of the rate limit of Calendar API"""
+        if self.rate_limit is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate_limit, self._allowance +
+                                  (now - self._last_call) * self.rate_limit)
+            self._last_call = now
+            if self._allowance < 1:
+                return False
+            self._allowance -= 1
+            return True
+
+    # Sheets
+
+    def spreadsheets(self, method, path, body, ranges=()):
+        spreadsheet_id, _, rest = path.partition('/')
+        spreadsheet_id, _, action = spreadsheet_id.partition(':')
+        with self._lock:
+            pages = self.sheets.setdefault(spreadsheet_id, [
+                {'sheetId': 0, 'title': 'errors', 'rows': []},
+                {'sheetId': 1, 'title': 'actions', 'rows': []}])
+            if method == 'GET' and not rest:
+                return json_response(200, {'sheets': [
+                    {'properties': {'sheetId': page['sheetId'], 'title': page['title'],
+                                    'gridProperties': {'rowCount': max(1000, len(page['rows']))}}}
+                    for page in pages]})
+            if method == 'GET' and rest == 'values:batchGet':
+                value_ranges = []
+                for value_range in ranges:  # Only whole first columns, 'page'!A:A
+                    title = value_range.rpartition('!')[0].strip("'").replace("''", "'")
+                    page = next(page for page in pages if page['title'] == title)
+                    value_ranges.append({'range': value_range, 'majorDimension': 'COLUMNS',
+                                         'values': [[row[0] for row in page['rows']]]})
+                return json_response(200, {'valueRanges': value_ranges})
+            request = json.loads(body.decode('utf-8') or '{}')
+            if action == 'batchUpdate':
+                for update in request['requests']:
+                    if 'addSheet' in update:
+                        pages.append(dict(update['addSheet']['properties'], rows=[]))
+                return json_response(200, {'spreadsheetId': spreadsheet_id})
+            match = re.fullmatch(r'values/(.+):append', rest)
+            if match:
+                title = unquote(match.group(1)).strip("'").replace("''", "'")
+                page = next(page for page in pages if page['title'] == title)
+                page['rows'].extend(request.get('values', []))
+                return json_response(200, {'spreadsheetId': spreadsheet_id})
+        return error_response(404, 'notFound', path)
+
+
+def api_of(path):
+    """Returns the name of the API that a request path belongs to"""
+    if path.startswith('/api/v3/'):
+        return 'openproject'
+    if path.startswith('/calendar/') or path.startswith('/batch/calendar'):
+        return 'calendar'
+    if path.startswith('/v4/spreadsheets'):
+        return 'sheets'
+    if path.startswith('/token'):
+        return 'oauth'
+    return 'other'
+
+
+def send_webhook(url, action, elem, secret=None):
+    """Posts a webhook of a work package as OpenProject does.
+
+    Returns:
+        status: HTTP status of the answer of the receiver
+    """
+    body = json.dumps({'action': action, 'work_package': elem}).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if secret is not None:
+        headers['X-OP-Signature'] = 'sha1=' + hmac.new(
+            secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+    request = urllib.request.Request(url, body, headers, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+
+def iso(date_time):
+    """Formats a datetime as OpenProject does, e.g. 2020-10-11T09:30:00Z"""
+    return date_time.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def json_response(status, payload):
+    return status, {'Content-Type': 'application/json; charset=UTF-8'}, \
+        json.dumps(payload).encode('utf-8')
+
+
+def conditional(request_headers, status, headers, content):
+    """Tags a successful response with an ETag, answers 304 if it matches"""
+    if status != 200:
+        return status, headers, content
+    etag = 'W/"{}"'.format(hashlib.md5(content).hexdigest())
+    if_none_match = {key.lower(): value for key, value in
+                     request_headers.items()}.get('if-none-match')
+    if if_none_match == etag:
+        return 304, {'ETag': etag}, b''
+
+    return status, dict(headers, ETag=etag), content
+
+
+def error_response(status, reason, message):
+    return json_response(status, {'error': {'code': status, 'message': message,
+                                            'errors': [{'reason': reason,
+                                                        'message': message}]}})
+
+
+def collection(elements, total, offset, page_size, self_url, query=None):
+    """Returns a HAL collection of OpenProject with pagination links"""
+    links = {'self': {'href': self_url}}
+    if offset * page_size < total:
+        params = dict(query or {}, offset=offset + 1, pageSize=page_size)
+        links['nextByOffset'] = {'href': self_url + '?' + '&'.join(
+            '{}={}'.format(key, value) for key, value in params.items())}
+    return {'_type': 'Collection', 'total': total, 'count': len(elements),
+            'pageSize': page_size, 'offset': offset,
+            '_embedded': {'elements': elements}, '_links': links}
+
+
+def select_fields(elem, select):
+    """Keeps the properties and links of a work package listed in `select`"""
+    fields = [field[len('elements/'):] for field in select.split(',')
+              if field.startswith('elements/')]
+    selected, links = {}, {}
+    for field in fields:
+        if field in elem:
+            selected[field] = elem[field]
+        elif field in elem['_links']:
+            links[field] = elem['_links'][field]
+    if links:
+        selected['_links'] = links
+    return selected
+
+
+def partial_response(payload, fields):
+    """Keeps the fields of a Google API response, e.g. 'id,items(id,summary)'"""
+    if not fields:
+        return payload
+    selected = {}
+    for field, nested in re.findall(r'(\w+)(?:\(([^()]*)\))?', fields):
+        if field not in payload:
+            continue
+        value = payload[field]
+        if nested and isinstance(value, list):
+            value = [partial_response(item, nested) for item in value]
+        elif nested and isinstance(value, dict):
+            value = partial_response(value, nested)
+        selected[field] = value
+    return selected
+
+
+def matches_filters(elem, filters):
+    """Applies the OpenProject filters used by the synchronization"""
+    for flt in filters:
+        for name, condition in flt.items():
+            operator, values = condition['operator'], condition.get('values', [])
+            value = elem.get(name)
+            if name == 'status':
+                if operator == 'o' and elem['status'] != 'open':
+                    return False
+            elif name == 'id':
+                if operator == '=' and str(elem['id']) not in values:
+                    return False
+            elif operator == '!*':
+                if value:
+                    return False
+            elif operator == '<>d':
+                if not value:
+                    return False
+                low, high = (values + ['', ''])[:2]
+                if (low and value < low) or (high and value[:len(high)] > high):
+                    return False
+    return True
+
+
+def in_window(event, query):
+    """Checks whether an event is within timeMin and timeMax of a listing"""
+    start = event.get('start', {}).get('dateTime')
+    end = event.get('end', {}).get('dateTime')
+    if not start or not end:
+        return True
+    start, end = parse_time(start), parse_time(end)
+    if 'timeMin' in query and end < parse_time(query['timeMin']):
+        return False
+    if 'timeMax' in query and start >= parse_time(query['timeMax']):
+        return False
+    return True
+
+
+def parse_time(text):
+    return datetime.fromisoformat(text.replace('Z', '+00:00'))
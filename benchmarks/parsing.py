@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of parsing work packages and events.
+
+Synthetic work packages of `fake_services` and the events created from them
+are parsed by the dictionary-based parsers that synchronization used before
+records were introduced, and by the current ones. For each size, the time
+and the memory retained by the parsed structures are reported in json, as
+well as the time to load the pages of work packages with the standard json
+module and with `synchronization.json_loads`, which is orjson or ujson if
+one of them is installed.
+
+Usage:
+    python3 benchmarks/parsing.py --sizes 1000 10000 100000 > parsing.json
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import synchronization as sync  # noqa: E402
+from benchmarks.fake_services import FakeServices, collection  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def dict_parse_workpackages(workpackages):
+    """Dictionary-based parser of work packages, as it was before records"""
+    parsed_wps = {}
+    err = []
+    for elem in workpackages:
+        if elem['description']['raw'] is None or \
+            elem['description']['raw'].split('\n')[0] == '!!!':
+            pass
+        else:
+            try:
+                tmp = {}
+                tmp['wp_id'] = elem['id']
+                tmp['subject'] = elem['subject'].strip()
+                tmp['description'] = elem['description']['html']
+                if elem['_links']['parent']['href']:
+                    tmp['parent'] = elem['_links']['parent']['href'].split('/')[-1] \
+                        + ":" + elem['_links']['parent']['title']
+                else:
+                    tmp['parent'] = "No parent"
+                if elem['_links']['assignee']['href']:
+                    tmp['assignee'] = elem['_links']['assignee']['title']
+                else:
+                    tmp['assignee'] = 'Not assigned to anyone'
+                if elem['dueDate']:
+                    tmp['due_date'] = elem['dueDate']
+                    tmp['due_hour'] = elem['description']['raw'].split('\n')[-1].split('=')[-1].strip()
+                else:
+                    tmp['due_date'] = elem['createdAt'].split('T')[0]
+                    tmp['due_hour'] = elem['createdAt'].split('T')[-1][:-1]
+                tmp['updated_at'] = elem['updatedAt']
+                parsed_wps[elem['id']] = tmp
+            except Exception as error:
+                err.append([elem, error])
+
+    return parsed_wps, err
+
+
+def dict_parse_events(events):
+    """Dictionary-based parser of events, as it was before records"""
+    parsed_events = {}
+    err = []
+    for elem in events:
+        try:
+            tmp = {}
+            tmp['event_id'] = elem['id']
+            summary = elem['summary'].split(':')
+            tmp['wp_id'] = summary[0]
+            tmp['subject'] = summary[-1]
+            description = elem['description'].split('\n')
+            tmp['assignee'] = description[-2]
+            tmp['updated_at'] = description[-1]
+            due = elem['end']['dateTime'].split('T')
+            tmp['due_date'] = due[0]
+            tmp['due_hour'] = due[1]
+            tmp['content_hash'] = sync.content_hash(elem)
+            tmp['field_hashes'] = sync.field_hashes(elem)
+            parsed_events[int(tmp['wp_id'])] = tmp
+        except Exception as error:
+            err.append([elem, error])
+
+    return parsed_events, err
+
+
+def measure(function, *args):
+    """Returns seconds of a call and bytes retained by its result"""
+    gc.collect()
+    tracemalloc.start()
+    result = function(*args)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    gc.collect()
+    start = time.perf_counter()
+    function(*args)
+
+    return {'seconds': round(time.perf_counter() - start, 6),
+            'retained_bytes': retained}
+
+
+def load_pages(loads, pages):
+    return [loads(page) for page in pages]
+
+
+def benchmark(size):
+    """Benchmarks parsers on `size` work packages and their events"""
+    services = FakeServices()
+    services.add_project(1, 'Benchmark')
+    services.seed_work_packages(1, size)
+    elements = list(services.work_packages[1].values())
+    pages = [json.dumps(collection(elements[start:start + PAGE_SIZE], size,
+                                   start // PAGE_SIZE + 1, PAGE_SIZE, '/')).encode('utf-8')
+             for start in range(0, size, PAGE_SIZE)]
+    parsed_wps, _ = sync.parse_workpackages(elements)
+    events = []
+    for wp_id, work_package in parsed_wps.items():
+        event = sync.wp_to_event(work_package)
+        event['id'] = 'event{}'.format(wp_id)
+        events.append(event)
+
+    return {
+        'size': size,
+        'json_backend': sync.json_loads.__module__,
+        'load_pages': {
+            'json': measure(load_pages, lambda page: json.loads(page.decode('utf-8')),
+                            pages),
+            'json_loads': measure(load_pages, sync.json_loads, pages)},
+        'parse_workpackages': {
+            'dict': measure(dict_parse_workpackages, elements),
+            'records': measure(sync.parse_workpackages, elements)},
+        'parse_events': {
+            'dict': measure(dict_parse_events, events),
+            'records': measure(sync.parse_events, events)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='numbers of work packages and events')
+    args = parser.parse_args()
+
+    print(json.dumps([benchmark(size) for size in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
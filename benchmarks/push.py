@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of synchronization driven by webhooks against local fake services.
+
+A fake OpenProject project is seeded and synchronized once, then `main.serve`
+keeps running with a webhook receiver while work packages are changed on the
+fake OpenProject, which calls the webhook as OpenProject does. Two scenarios
+are measured:
+    single: work packages are changed one at a time, each after the previous
+        one has reached the calendar
+    burst: many work packages are changed at once, e.g. by a bulk edit
+For each scenario, the seconds from a change until its event is updated on
+the calendar, the number of synchronizations and the requests per API are
+reported. Latency includes the debounce of the queue (`--debounce`).
+
+Usage:
+    python3 benchmarks/push.py --size 10000 --changes 20 --burst 200
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import main  # noqa: E402
+import synchronization as sync  # noqa: E402
+from benchmarks import end_to_end  # noqa: E402
+from benchmarks.fake_services import FakeServices  # noqa: E402
+from webhook_receiver import ChangeQueue, WebhookReceiver  # noqa: E402
+
+SECRET = 'benchmark'
+
+
+def wait_for(condition, timeout, interval=0.005):
+    """Waits until condition() is true, returns the seconds waited"""
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError('the calendar has not been updated in time')
+        time.sleep(interval)
+
+    return time.perf_counter() - start
+
+
+def summary_of(services, wp_id):
+    """Returns the summary of the event of a work package on the fake calendar"""
+    event_id = sync.event_id(end_to_end.PROJECT_ID, wp_id)
+    event = services.calendars.get(end_to_end.CALENDAR_ID, {}).get(event_id)
+
+    return None if event is None else event.get('summary')
+
+
+def benchmark(args):
+    services = FakeServices(args.latency).start()
+    services.add_project(end_to_end.PROJECT_ID, end_to_end.PROJECT_NAME)
+    services.seed_work_packages(end_to_end.PROJECT_ID, args.size)
+    runs, finished = [], []
+    original_run = main.run
+
+    def counted_run(*run_args, **kwargs):
+        runs.append(run_args[2] if len(run_args) > 2 else kwargs.get('wp_ids'))
+        try:
+            return original_run(*run_args, **kwargs)
+        finally:
+            finished.append(runs[-1])
+
+    def settled():  # Events are stored before the answers are counted
+        return wait_for(lambda: len(finished) == len(runs), 600)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, \
+            contextlib.redirect_stdout(io.StringIO()):
+        end_to_end.discovery_cache(os.path.join(directory, 'discovery'), services.url)
+        parameters = {
+            'path_to_secret_file': end_to_end.service_account_file(
+                directory, services.url + 'token'),
+            'SCOPES': end_to_end.SCOPES,
+            'calendar_id': end_to_end.CALENDAR_ID,
+            'openproject_api_url': services.url + 'api/v3/',
+            'openproject_api_key': 'benchmark',
+            'project_name': end_to_end.PROJECT_NAME,
+            'save_logs': False,
+            'sheet_id': '',
+            'state_file': os.path.join(directory, 'state.sqlite3'),
+            'use_event_index': True,
+            'batch_size': 50,
+            'discovery_cache_dir': os.path.join(directory, 'discovery'),
+            'webhook_secret': SECRET,
+        }
+        context = main.create_context(parameters)
+        queue = ChangeQueue(args.debounce, args.max_delay)
+        receiver = WebhookReceiver(queue, secret=SECRET).start()
+        stop = threading.Event()
+        main.run = counted_run
+        server = threading.Thread(target=main.serve, args=(
+            parameters, context, stop, args.interval, 0, queue))
+        server.start()
+        try:
+            wait_for(lambda: runs and summary_of(services, args.size) is not None, 600)
+            settled()
+            services.subscribe(receiver.url, SECRET)
+            wp_ids = list(services.work_packages[end_to_end.PROJECT_ID])
+            for scenario, changed in (('single', wp_ids[:args.changes]),
+                                      ('burst', wp_ids[-args.burst:])):
+                runs.clear()
+                finished.clear()
+                requests = services.counters()[0]
+                latencies = []
+                if scenario == 'single':
+                    for wp_id in changed:
+                        subject = 'Changed {}'.format(wp_id)
+                        services.change_work_package(end_to_end.PROJECT_ID, wp_id,
+                                                     subject=subject)
+                        latencies.append(wait_for(lambda: (summary_of(
+                            services, wp_id) or '').endswith(subject), 60))
+                else:
+                    start = time.perf_counter()
+                    for wp_id in changed:
+                        services.change_work_package(end_to_end.PROJECT_ID, wp_id,
+                                                     subject='Burst {}'.format(wp_id))
+                    wait_for(lambda: all((summary_of(services, wp_id) or '').endswith(
+                        'Burst {}'.format(wp_id)) for wp_id in changed), 600)
+                    latencies.append(time.perf_counter() - start)
+                settled()
+                results[scenario] = {
+                    'changes': len(changed),
+                    'median_seconds': round(statistics.median(latencies), 6),
+                    'max_seconds': round(max(latencies), 6),
+                    'synchronizations': len(runs),
+                    'requests': dict(services.counters()[0] - requests)}
+        finally:
+            stop.set()
+            queue.close()
+            server.join()
+            main.run = original_run
+            receiver.stop()
+            main.close_context(context)
+    services.stop()
+
+    return results
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--size', type=int, default=1000,
+                        help='number of work packages of the project')
+    parser.add_argument('--changes', type=int, default=10,
+                        help='number of work packages changed one at a time')
+    parser.add_argument('--burst', type=int, default=100,
+                        help='number of work packages changed at once')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='webhook_debounce parameter of the synchronization')
+    parser.add_argument('--max-delay', type=float, default=10,
+                        help='webhook_max_delay parameter of the synchronization')
+    parser.add_argument('--interval', type=float, default=3600,
+                        help='seconds between full synchronizations')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the fake services wait before each answer')
+    args = parser.parse_args()
+
+    print(json.dumps({'parameters': vars(args), 'results': benchmark(args)},
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the startup time of a synchronization run.
+
+Each scenario is measured in a new interpreter, as it happens when a
+scheduled task starts `main.py`, and the median of several repeats is
+reported in json. Scenarios:
+    import_synchronization: importing `synchronization`, Google API client
+        libraries are imported lazily
+    import_google_libraries: importing the Google API client libraries that
+        `synchronization` used to import at the top
+    build_with_discovery: building Calendar and Sheets services by
+        `googleapiclient.discovery.build`, as it used to be done
+    build_from_cache: building Calendar service from the cached discovery
+        document, as a run with `save_logs=False` does
+
+Usage:
+    python3 benchmarks/startup.py --repeat 5 > startup.json
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each scenario prints the seconds it takes
+TIMER = "import time; start = time.perf_counter()\n{}\nprint(time.perf_counter() - start)"
+CREDENTIALS = "from google.auth.credentials import AnonymousCredentials\n"
+SCENARIOS = {
+    'import_synchronization': TIMER.format("import synchronization"),
+    'import_google_libraries': TIMER.format(
+        "import requests\n"
+        "from google.oauth2 import service_account\n"
+        "from googleapiclient.discovery import build"),
+    'build_with_discovery': CREDENTIALS + TIMER.format(
+        "from googleapiclient.discovery import build\n"
+        "build('calendar', 'v3', credentials=AnonymousCredentials())\n"
+        "build('sheets', 'v4', credentials=AnonymousCredentials())"),
+    'build_from_cache': CREDENTIALS + TIMER.format(
+        "import synchronization as sync\n"
+        "sync.google_calendar_service(AnonymousCredentials())"),
+}
+
+
+def measure(code, repeat):
+    """Runs the code in new interpreters and returns the measured seconds"""
+    seconds = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=REPOSITORY,
+                                check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        seconds.append(float(output.split()[-1]))
+
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of interpreters started for each scenario')
+    args = parser.parse_args()
+
+    # The first build downloads the discovery document to the cache
+    measure(SCENARIOS['build_from_cache'], 1)
+    report = {}
+    for name, code in SCENARIOS.items():
+        try:
+            seconds = measure(code, args.repeat)
+            report[name] = {'median_seconds': statistics.median(seconds),
+                            'seconds': seconds}
+        except subprocess.CalledProcessError as error:  # e.g. no network
+            report[name] = {'error': str(error)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
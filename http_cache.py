@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of OpenProject responses that are revalidated with conditional GETs.
+
+Each run downloads the projects and the pages of work packages again, even
+if nothing has changed since the previous run. OpenProject tags responses
+with an `ETag` (and some of them with `Last-Modified`), thus a request can
+ask for the response only if it differs from a version it already has. The
+OpenProject session of `synchronization` is mounted with a CachingAdapter
+that keeps the content of such responses with their validators in a SQLite
+file. Later GET requests of the same url send `If-None-Match` and
+`If-Modified-Since`, and a `304 Not Modified` answer, which has no body, is
+replaced with the cached content. The size of the file is bounded: the
+least recently used responses are evicted when it grows beyond a limit.
+
+The cache also memoizes values that rarely change for a while, e.g. the ids
+of projects, see ResponseCache.memoized().
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from requests.adapters import HTTPAdapter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+CREATE TABLE IF NOT EXISTS memo (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class ResponseCache:
+    """Contents of responses and their validators kept in a SQLite database.
+
+    Like state_store.StateStore, a single connection is shared by all
+    threads and guarded with a lock, and several processes may use the same
+    file. Each response is keyed by its url and its credentials, thus
+    sessions with different API keys never see each other's responses.
+
+    Args:
+        path: path to the SQLite database file, created if it does not exist
+        max_bytes: the least recently used responses are evicted when their
+            total size exceeds this, responses larger than it are not kept
+    """
+
+    def __init__(self, path, max_bytes=100 * 2**20):
+        self.max_bytes = max_bytes
+        self._connection = sqlite3.connect(path, timeout=30,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def get(self, key):
+        """Returns etag, last_modified and content saved with `key`, else None"""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT etag, last_modified, content FROM responses WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None:  # Recently used, evicted last
+                self._connection.execute(
+                    'UPDATE responses SET used_at = ? WHERE key = ?',
+                    (time.time(), key))
+
+        return row
+
+    def put(self, key, etag, last_modified, content):
+        """Saves a response, and evicts the least recently used ones if needed"""
+        if len(content) > self.max_bytes:
+            return
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, etag, last_modified, content, size, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, content, len(content), time.time()))
+            excess = self._connection.execute(
+                'SELECT SUM(size) FROM responses').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for old_key, size in self._connection.execute(
+                        'SELECT key, size FROM responses ORDER BY used_at'):
+                    if excess <= 0:
+                        break
+                    evicted.append((old_key,))
+                    excess -= size
+                self._connection.executemany('DELETE FROM responses WHERE key = ?',
+                                             evicted)
+
+    def memoized(self, key, ttl, function):
+        """Returns the value of `function()`, computed at most once in `ttl` seconds.
+
+        The value is saved as json, and reused by this and other processes
+        until it expires. A `ttl` of 0 computes the value again.
+        """
+        now = time.time()
+        if ttl > 0:
+            with self._lock:
+                row = self._connection.execute(
+                    'SELECT value FROM memo WHERE key = ? AND expires_at > ?',
+                    (key, now)).fetchone()
+            if row is not None:
+                return json.loads(row[0])
+        value = function()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO memo (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), now + ttl))
+
+        return value
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._connection.close()
+
+
+class CachingAdapter(HTTPAdapter):
+    """Transport adapter of requests that revalidates cached GET responses.
+
+    Successful GET responses with an `ETag` or `Last-Modified` header are
+    saved to the cache. When the same url is requested again, its validators
+    are sent, and if the server answers `304 Not Modified`, the response is
+    turned into a `200` with the cached content and its `from_cache`
+    attribute is set. Other requests pass through unchanged.
+
+    Args:
+        cache: ResponseCache where responses are kept
+        **kwargs: arguments of HTTPAdapter, e.g. `pool_maxsize`
+    """
+
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        key = cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None:
+            etag, last_modified, content = entry
+            if etag:
+                request.headers['If-None-Match'] = etag
+            if last_modified:
+                request.headers['If-Modified-Since'] = last_modified
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.content  # Reads the empty body, releases the connection
+            response.status_code = 200
+            response.reason = 'OK'
+            response._content = bytes(content)
+            response.from_cache = True
+        elif response.status_code == 200 and ('ETag' in response.headers or
+                                               'Last-Modified' in response.headers):
+            self.cache.put(key, response.headers.get('ETag'),
+                           response.headers.get('Last-Modified'), response.content)
+
+        return response
+
+
+def cache_key(request):
+    """Returns the key of a request: its url and a digest of its credentials"""
+    authorization = request.headers.get('Authorization', '')
+
+    return '{} {}'.format(hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:16],
+                          request.url)
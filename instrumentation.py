@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-run measurements of the synchronization and their reports.
+
+A run records the time spent in each of its phases, e.g. `read_workpackages`
+or `synchronize_wps`, HTTP requests, transferred bytes and retries of each
+API, and the number of created, updated and deleted events. At the end of
+the run, measurements are written as a json report and as a Prometheus
+textfile that the textfile collector of node_exporter exposes. Optionally, a
+phase is profiled with cProfile to see which functions take its time.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+ACTIONS = ('create', 'delete', 'update')
+
+
+class RunMetrics:
+    """Measurements of a synchronization run.
+
+    Time of a phase excludes the phases nested in it, e.g. reading a page of
+    work packages while they are parsed is counted in `read_workpackages`,
+    not in `parse_workpackages`. Phases of projects synchronized in parallel
+    are summed. Measurements are cleared by start() at the beginning of each
+    run. All methods can be called from any thread.
+
+    Args:
+        profile_phase: optional, name of the phase profiled with cProfile
+        profile_file: file where the profile of the phase is dumped
+    """
+
+    def __init__(self, profile_phase=None, profile_file='profile.prof'):
+        self.profile_phase = profile_phase
+        self.profile_file = profile_file
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """Clears the measurements of the previous run"""
+        with self._lock:
+            self.started_at = datetime.now()
+            self._start = time.perf_counter()
+            self.phases = {}
+            self.requests = Counter()
+            self.bytes = Counter()
+            self.retries = Counter()
+            self.actions = {action: Counter() for action in ACTIONS}
+            self.projects = Counter()
+            self._profilers = []
+        self._local = threading.local()  # Drops profilers of the previous run
+
+    @contextmanager
+    def phase(self, name):
+        """Measures the time of a phase executed in the context"""
+        stack = self._local.__dict__.setdefault('stack', [])
+        profiler = self._profiler(name, stack)
+        stack.append([name, 0.0])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, nested = stack.pop()
+            if profiler is not None:
+                profiler.disable()
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                seconds, calls = self.phases.get(name, (0.0, 0))
+                self.phases[name] = (seconds + elapsed - nested, calls + 1)
+
+    def timed(self, iterable, name):
+        """Yields items of an iterable, producing each is measured as the phase"""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _profiler(self, name, stack):
+        """Enables and returns the profiler of this thread if `name` is profiled"""
+        if name != self.profile_phase or any(frame[0] == name for frame in stack):
+            return None
+        profiler = self._local.__dict__.get('profiler')
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler is active
+            return None
+
+        return profiler
+
+    def record_request(self, api, sent=0, received=0):
+        """Counts an HTTP request to the API and its transferred bytes"""
+        with self._lock:
+            self.requests[api] += 1
+            self.bytes[api] += sent + received
+
+    def record_retry(self, api, count=1):
+        """Counts retried requests to the API"""
+        with self._lock:
+            self.retries[api] += count
+
+    def record_actions(self, action, attempted, failed):
+        """Counts calendar calls of an action, e.g. 'create', and failed ones"""
+        with self._lock:
+            self.actions[action]['attempted'] += attempted
+            self.actions[action]['failed'] += failed
+
+    def record_project(self, succeeded):
+        """Counts a synchronized project"""
+        with self._lock:
+            self.projects['succeeded' if succeeded else 'failed'] += 1
+
+    def google_observer(self, uri, method, body, response, content):
+        """Observer of transport.PooledHttp, counts requests to Google APIs"""
+        self.record_request(google_api(uri), len(body or b''), len(content or b''))
+
+    def openproject_hook(self, response, *args, **kwargs):
+        """Response hook of the OpenProject session, counts its requests.
+
+        Received bytes are counted as they are on the wire, i.e. compressed.
+        Content of responses revalidated from http_cache is not received.
+        """
+        content = response.content
+        if getattr(response, 'from_cache', False):  # 304 Not Modified
+            received = 0
+        else:
+            try:
+                received = response.raw.tell()
+            except AttributeError:  # Not read from a connection
+                received = 0
+            received = received or len(content)
+        self.record_request('openproject', len(response.request.body or b''),
+                            received)
+
+    def report(self):
+        """Returns measurements of the run as a dictionary"""
+        with self._lock:
+            apis = set(self.requests) | set(self.retries)
+            return {
+                'started_at': self.started_at.isoformat(),
+                'seconds': round(time.perf_counter() - self._start, 6),
+                'phases': {name: {'seconds': round(seconds, 6), 'calls': calls}
+                           for name, (seconds, calls) in sorted(self.phases.items())},
+                'apis': {api: {'requests': self.requests[api],
+                               'bytes': self.bytes[api],
+                               'retries': self.retries[api]}
+                         for api in sorted(apis)},
+                'actions': {action: {'attempted': counts['attempted'],
+                                     'failed': counts['failed']}
+                            for action, counts in self.actions.items()},
+                'projects': {'succeeded': self.projects['succeeded'],
+                             'failed': self.projects['failed']},
+            }
+
+    def finish(self, report_file=None, metrics_file=None):
+        """Writes the reports of the run and the profile, if they are requested.
+
+        Args:
+            report_file: optional, path of the json report
+            metrics_file: optional, path of the Prometheus textfile, it
+                should end with `.prom` to be read by the textfile collector
+
+        Returns:
+            report: measurements of the run as returned from report()
+        """
+        report = self.report()
+        if report_file:
+            write_atomically(report_file, json.dumps(report, indent=2))
+        if metrics_file:
+            write_atomically(metrics_file, prometheus_text(report))
+        with self._lock:
+            profilers = list(self._profilers)
+        if profilers:
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            stats.dump_stats(self.profile_file)
+
+        return report
+
+
+def google_api(uri):
+    """Returns the name of the Google API that a request is sent to"""
+    url = urlsplit(uri)
+    if url.netloc.startswith('sheets.') or url.path.startswith('/v4/spreadsheets'):
+        return 'sheets'
+    if 'calendar' in url.path:
+        return 'calendar'
+    return 'google'
+
+
+def prometheus_text(report):
+    """Formats a run report in Prometheus text exposition format"""
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append('# HELP op2gc_{} {}'.format(name, help_text))
+        lines.append('# TYPE op2gc_{} gauge'.format(name))
+        for labels, value in samples:
+            label_text = ','.join('{}="{}"'.format(key, label_value)
+                                  for key, label_value in labels)
+            lines.append('op2gc_{}{} {}'.format(
+                name, '{' + label_text + '}' if label_text else '', value))
+
+    metric('last_run_timestamp_seconds', 'Start time of the last run.',
+           [((), round(datetime.fromisoformat(report['started_at']).timestamp(), 3))])
+    metric('run_seconds', 'Duration of the last run.', [((), report['seconds'])])
+    metric('phase_seconds', 'Time spent in each phase of the last run.',
+           [((('phase', name),), phase['seconds'])
+            for name, phase in report['phases'].items()])
+    for key, help_text in (('requests', 'HTTP requests of the last run.'),
+                           ('bytes', 'Bytes transferred in the last run.'),
+                           ('retries', 'Retried requests of the last run.')):
+        metric('http_' + key, help_text,
+               [((('api', api),), counts[key]) for api, counts in report['apis'].items()])
+    metric('events', 'Calendar calls of the last run by action and result.',
+           [((('action', action), ('result', result)), counts[result])
+            for action, counts in report['actions'].items()
+            for result in ('attempted', 'failed')])
+    metric('projects', 'Projects synchronized in the last run by result.',
+           [((('result', result),), count) for result, count in report['projects'].items()])
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_atomically(path, text):
+    """Writes a file so that readers never see it half-written"""
+    with open(path + '.tmp', 'w', encoding='utf-8') as output_file:
+        output_file.write(text)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local, rotating log store of synchronizations that is flushed to Google Sheets.
+
+Appending logs of each synchronization directly to one sheet gets slower as
+the sheet grows and eventually times out (around the 918th synchronization).
+Instead, logs are appended to local files first. The files are rotated daily
+or when they reach a size limit, and only the most recent ones are kept.
+Pending logs are flushed to the sheet in the background with a single
+`append` call per page and batch. When a page of the sheet reaches a number of
+rows, a new page, e.g. "errors 2", is added and logs continue there. Thus,
+neither a large log history nor a slow Sheets call delays synchronization.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from synchronization import log_rows
+
+PAGES = ('errors', 'actions')
+
+
+class LogSink:
+    """Appends logs to rotating local files and flushes them to a sheet.
+
+    Log files are named `sync-YYYY-MM-DD.NNNN.jsonl`, one json record per
+    line. The position of the first log that is not flushed yet is kept in
+    `cursor.json`. If a file is removed by rotation before it is flushed,
+    its logs are never flushed.
+
+    Args:
+        directory: directory of log files, created if it does not exist
+        max_bytes: a new file is started when the current one exceeds it
+        max_files: number of most recent files kept
+        max_rows: a new page is added when a page of the sheet exceeds it
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024, max_files=30,
+                 max_rows=10000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_rows = max_rows
+        self._lock = threading.Lock()  # Guards the files
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._flusher = None
+        self._used_rows = {}  # Rows of logs on the pages, guarded by flush lock
+
+    def write(self, wps, errors, label=None):
+        """Appends logs of a synchronization to the current log file.
+
+        Args:
+            wps: classified wp_ids as create, delete or update
+            errors: raised errors from calendar operations
+            label: optional, written next to the log time, e.g. project name
+        """
+        record = {'time': datetime.now().isoformat(), 'label': label,
+                  'wps': [sorted(str(elem) for elem in ids) for ids in wps],
+                  'errors': [[str(elem) for elem in elems] for elems in errors]}
+        with self._lock:
+            with open(self._current_file(), 'a', encoding='utf-8') as log_file:
+                log_file.write(json.dumps(record) + '\n')
+            self._remove_old_files()
+
+    def flush(self, sheet_service, sheet_id, batch_records=200):
+        """Flushes pending logs to the sheet, `batch_records` logs per call.
+
+        Returns:
+            flushed: number of logs flushed
+        """
+        flushed = 0
+        with self._flush_lock:
+            while True:
+                records, cursor = self._pending(batch_records)
+                if not records:
+                    return flushed
+                rows = {page: [] for page in PAGES}
+                for record in records:
+                    log_time = [record['time']]
+                    if record['label'] is not None:
+                        log_time.append(record['label'])
+                    for page, values in log_rows(record['wps'], record['errors'],
+                                                 log_time).items():
+                        rows[page].extend(values)
+                append_rows(sheet_service, sheet_id, rows, self.max_rows,
+                            self._used_rows)
+                self._save_cursor(cursor)
+                flushed += len(records)
+
+    def flush_in_background(self, sheet_service, sheet_id):
+        """Starts flushing pending logs to the sheet in a background thread.
+
+        If a previous flush is still running, a new one is not started; the
+        logs will be flushed by the next call.
+        """
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+
+        def flush_quietly():
+            try:
+                self.flush(sheet_service, sheet_id)
+            except Exception as error:  # Pending logs are flushed next time
+                print('Logs could not be flushed to the sheet: %r' % error)
+
+        self._flusher = threading.Thread(target=flush_quietly, daemon=True)
+        self._flusher.start()
+
+    def wait(self, timeout=None):
+        """Waits for the background flush at most `timeout` seconds"""
+        if self._flusher is not None:
+            self._flusher.join(timeout)
+
+    def _files(self):
+        """Returns names of log files from the oldest to the newest"""
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith('sync-') and name.endswith('.jsonl'))
+
+    def _current_file(self):
+        """Returns the path of the file to append, rotates if required"""
+        prefix = 'sync-{}.'.format(datetime.now().date().isoformat())
+        todays = [name for name in self._files() if name.startswith(prefix)]
+        number = 0
+        if todays:
+            number = int(todays[-1].split('.')[-2])
+            if os.path.getsize(os.path.join(self.directory, todays[-1])) >= self.max_bytes:
+                number += 1
+
+        return os.path.join(self.directory, '{}{:04d}.jsonl'.format(prefix, number))
+
+    def _remove_old_files(self):
+        """Keeps the most recent `max_files` log files"""
+        for name in self._files()[:-self.max_files]:
+            os.remove(os.path.join(self.directory, name))
+
+    def _load_cursor(self):
+        """Returns the file name and offset of the first pending log"""
+        try:
+            with open(os.path.join(self.directory, 'cursor.json'),
+                      encoding='utf-8') as cursor_file:
+                cursor = json.load(cursor_file)
+            return cursor['file'], cursor['offset']
+        except (OSError, ValueError, KeyError):  # Nothing is flushed yet
+            return '', 0
+
+    def _save_cursor(self, cursor):
+        path = os.path.join(self.directory, 'cursor.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as cursor_file:
+            json.dump({'file': cursor[0], 'offset': cursor[1]}, cursor_file)
+        os.replace(path + '.tmp', path)
+
+    def _pending(self, limit):
+        """Returns at most `limit` pending logs and the cursor after them"""
+        cursor_file, offset = self._load_cursor()
+        records = []
+        with self._lock:
+            for name in self._files():
+                if name < cursor_file:  # Already flushed
+                    continue
+                start = offset if name == cursor_file else 0
+                with open(os.path.join(self.directory, name), 'rb') as log_file:
+                    log_file.seek(start)
+                    for line in iter(log_file.readline, b''):
+                        if not line.endswith(b'\n'):  # Being written
+                            break
+                        records.append(json.loads(line.decode('utf-8')))
+                        start += len(line)
+                        if len(records) == limit:
+                            return records, (name, start)
+                cursor_file, offset = name, start
+
+        return records, (cursor_file, offset)
+
+
+def append_rows(sheet_service, sheet_id, rows, max_rows, used_rows=None):
+    """Appends rows to the pages of the sheet with a single call per page.
+
+    Logs are appended to the last page of each kind, e.g. "errors 3". If the
+    page would exceed `max_rows`, a new page is added first, pages of all
+    kinds with a single batchUpdate call. Values are appended as if they were
+    typed in (`USER_ENTERED`), as save_logs() does, thus times and numbers
+    are parsed by Sheets instead of being kept as text. The grid of a page, 1000 rows for a new one, tells nothing about the rows in
+    use. Thus, rows in use are counted in `used_rows`, and the first column
+    of a page that is not counted yet is read to count them.
+
+    Args:
+        sheet_service: Authorized Google Sheet API service
+        sheet_id: Id of the sheet in which logs are saved
+        rows: a dictionary of rows to append, key is the kind of the page
+        max_rows: maximum number of rows of a page
+        used_rows: optional, a dictionary of the rows in use, key is the
+            title of the page. It is updated with the appended rows, and
+            should be kept between calls to skip counting them again.
+    """
+    used_rows = {} if used_rows is None else used_rows
+    spreadsheet = sheet_service.spreadsheets().get(
+        spreadsheetId=sheet_id, fields='sheets(properties(sheetId,title))').execute()
+    pages = [sheet['properties'] for sheet in spreadsheet.get('sheets', [])]
+    next_id = max([page['sheetId'] for page in pages] + [0]) + 1
+
+    # The last page of each kind
+    last_pages = {}
+    for kind, values in rows.items():
+        numbered = [(page_number(page['title'], kind), page) for page in pages]
+        numbered = [(number, page) for number, page in numbered if number is not None]
+        if values and numbered:
+            last_pages[kind] = max(numbered, key=lambda item: item[0])
+    count_used_rows(sheet_service, sheet_id, [
+        page['title'] for _, page in last_pages.values()
+        if page['title'] not in used_rows], used_rows)
+
+    requests, appends = [], []
+    for kind, values in rows.items():
+        if not values:
+            continue
+        if kind in last_pages:
+            number, page = last_pages[kind]
+            title = page['title']
+        if kind not in last_pages or used_rows[title] + len(values) > max_rows:
+            number = last_pages[kind][0] + 1 if kind in last_pages else 1
+            page_id, next_id = next_id, next_id + 1
+            title = kind if number == 1 else '{} {}'.format(kind, number)
+            requests.append({'addSheet': {'properties': {'sheetId': page_id,
+                                                         'title': title}}})
+            used_rows[title] = 0
+        appends.append((title, values))
+
+    try:
+        if requests:
+            sheet_service.spreadsheets().batchUpdate(
+                spreadsheetId=sheet_id, body={'requests': requests},
+                fields='spreadsheetId').execute()
+        for title, values in appends:
+            sheet_service.spreadsheets().values().append(
+                spreadsheetId=sheet_id, range="'{}'".format(title.replace("'", "''")),
+                valueInputOption='USER_ENTERED', insertDataOption='INSERT_ROWS',
+                body={'values': values}, fields='spreadsheetId').execute()
+            used_rows[title] += len(values)
+    except Exception:  # Rows might be appended or not, count them again
+        used_rows.clear()
+        raise
+
+
+def count_used_rows(sheet_service, sheet_id, titles, used_rows):
+    """Counts the rows in use on the pages with given titles into `used_rows`.
+
+    Every row of logs has a value in its first column, e.g. the log time,
+    and Google leaves out the empty rows at the end of a range, thus the
+    length of the first column is the number of rows in use.
+    """
+    if not titles:
+        return
+    result = sheet_service.spreadsheets().values().batchGet(
+        spreadsheetId=sheet_id, majorDimension='COLUMNS',
+        ranges=["'{}'!A:A".format(title.replace("'", "''")) for title in titles],
+        fields='valueRanges(values)').execute()
+    used_rows.update((title, 0) for title in titles)
+    for title, value_range in zip(titles, result.get('valueRanges', [])):
+        used_rows[title] = len((value_range.get('values') or [[]])[0])
+
+
+def page_number(title, kind):
+    """Returns the number of a page of given kind, e.g. 3 for "errors 3"."""
+    if title == kind:
+        return 1
+    if title.startswith(kind + ' ') and title[len(kind) + 1:].isdigit():
+        return int(title[len(kind) + 1:])
+    return None
@@ -22,15 +22,38 @@ If the task starts with three exclamations (!) marks, it will not be synchronize
 %% $Copyright: Tapir Lab.$
 %%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 """
+import argparse
+import json
+import random
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import synchronization as sync
+from instrumentation import RunMetrics
+from http_cache import ResponseCache
+from log_sink import LogSink
+from state_store import StateStore
+from token_cache import TokenCache
 
-def main(parameters):
+def main(parameters, wp_ids=None):
     """Synchronizes OpenProject tasks with Google Calendar.
 
     The main function executes the synchronization task. Its parameters are given
     as a dictionary to ease calls. Each of the parameters should be defined
-    except the `sheet_id` parameter if `save_logs` is `False`.
+    except the `sheet_id` parameter if `save_logs` is `False`, and the
+    `project_name` and `calendar_id` parameters if `projects` is given, and
+    the `calendar_id` parameter if `assignee_calendars` is given.
+
+    Several projects can be synchronized to their calendars in a single run
+    by listing them in `projects`. OpenProject session, credentials and
+    services are created once and shared. Projects are synchronized in
+    parallel, and an error in one of them does not affect the others. If
+    `wp_ids` are given, only those work packages are synchronized without
+    listing the calendar, e.g. right after they are changed. To synchronize
+    periodically in a single process instead of a scheduled task, see
+    daemon().
 
     Args:
         parameters: required parameters to complete synchronization
@@ -43,60 +66,740 @@ def main(parameters):
             'project_name': name of your OpenProject Project,
             'save_logs': whether you want to sync logs to sheet or not,
             'sheet_id': Google Sheet id, if 'save_logs' false, can be an empty string
+            'projects': optional, a list of {'project_name': ..., 'calendar_id': ...}
+                to synchronize instead of 'project_name' and 'calendar_id'
+            'max_parallel_projects': optional, number of projects synchronized
+                at the same time, default is 4
+            'assignee_calendars': optional, a dictionary of calendar ids
+                whose keys are assignees, work packages are synchronized to
+                the calendars of their assignees, others to 'calendar_id'.
+                It can also be given in each pair of 'projects'.
+            'max_parallel_calendars': optional, number of calendars of
+                assignees synchronized at the same time, default is 4
+            'token_cache_file': optional, path to the file where the access
+                token of the service account is kept for the next runs
+            'state_file': optional, path to the file where the state of
+                synchronization is kept between runs to read incrementally,
+                and the journal of calendar calls to finish them if a run
+                is interrupted
+            'openproject_cache_file': optional, path to the file where
+                responses of OpenProject are kept to be revalidated with
+                conditional requests, and project ids are memoized
+            'openproject_cache_size': optional, maximum size of the cached
+                responses in megabytes, default is 100
+            'projects_ttl': optional, seconds during which memoized project
+                ids are used, default is 3600
+            'page_size': optional, number of work packages read per request,
+                default is 100
+            'select_fields': optional, whether only the parsed fields of work
+                packages are requested, default is True
+            'window_past_days': optional, only the work packages and events
+                due in a window from this many days ago are synchronized,
+                default is 30 if 'window_future_days' is given
+            'window_future_days': optional, the window ends this many days
+                later, default is 365 if 'window_past_days' is given.
+                Everything is synchronized if neither of them is given.
+            'window_shard_days': optional, the window is read in parallel in
+                shards of this many days, default is 90
+            'batch_size': optional, number of calendar calls grouped into
+                a batch request (at most 50), calls are not batched if None
+            'max_workers': optional, number of calendar calls executed
+                concurrently if calls are not batched
+            'requests_per_second': optional, rate limit of calendar calls
+            'max_retries': optional, number of retries of a calendar call
+                that fails due to rate limits or server errors
+            'http_pool_size': optional, number of connections to Google APIs
+                kept open and shared by all threads, default is 10
+            'http_timeout': optional, seconds to wait for connecting to
+                Google APIs and for each read, default is 60
+            'use_event_index': optional, whether events are read from the
+                local index of synchronized events instead of the calendar,
+                requires 'state_file'
+            'reconcile_interval': optional, seconds between two readings of
+                the calendar to repair the index, default is one day
+            'discovery_cache_dir': optional, directory where discovery
+                documents of Google APIs are cached
+            'log_dir': optional, directory of local log files, 'logs' by
+                default if 'save_logs' is True
+            'log_rows_per_page': optional, a new page is added to the sheet
+                when a page of logs exceeds this many rows, default is 10000
+            'log_flush_timeout': optional, seconds to wait for logs being
+                flushed to the sheet before exiting, default is 60
+            'run_report': optional, path of the json report of phase times,
+                requests, retries and calendar calls written after each run
+            'metrics_file': optional, path of the Prometheus textfile, e.g.
+                '/var/lib/node_exporter/op2gc.prom', written after each run
+            'profile_phase': optional, name of the phase profiled with
+                cProfile, e.g. 'synchronize_wps'
+            'profile_file': optional, file of the profile, default is
+                'profile.prof'
+            'webhook_secret': optional, secret of the webhook on OpenProject,
+                webhooks without its signature are rejected, see daemon()
+            'webhook_debounce': optional, changes received by webhooks are
+                synchronized when none has arrived for this many seconds,
+                default is 5
+            'webhook_max_delay': optional, changes are synchronized at most
+                this many seconds after they are received, default is 60
             }
+        wp_ids: optional, IDs of the work packages to synchronize, requires
+            'state_file' and 'use_event_index', see check_targeted()
     """
-    # Google Calendar and Sheets API Configurations
-    # Path to service account credentials json file
-    secret_file = parameters['path_to_secret_file']
-    # Scopes to create API services
-    scopes = parameters['SCOPES']
-    # Calendar ID
-    calendar_id = parameters['calendar_id']
-
-    # OpenProject API configurations, session authorization and reading
-    url = parameters['openproject_api_url']
-    api_key = parameters['openproject_api_key']
-    project_name = parameters['project_name'] # Name of your project as it is seen on OpenProject
+    if wp_ids:
+        check_targeted(parameters)
+    context = create_context(parameters)
+    try:
+        run(parameters, context, wp_ids)
+    finally:
+        close_context(context)
+
+
+def daemon(parameters, interval=600, jitter=60, webhook=None):
+    """Synchronizes periodically in a long-running process.
+
+    Unlike starting a new process for each synchronization, the OpenProject
+    session, credentials and Google services are created once and kept warm.
+    The access token of the credentials is refreshed before it expires.
+    Synchronizations are `interval` seconds apart, shifted randomly by up to
+    `jitter` seconds so that several daemons do not hit the APIs at once. An
+    error in a synchronization is printed and the next one is waited for.
+    SIGTERM or SIGINT stops the daemon after the current synchronization.
+
+    If a `webhook` address is given, webhooks of OpenProject are received on
+    it, see webhook_receiver.WebhookReceiver, and changed work packages are
+    synchronized shortly after they change, in between the periodic
+    synchronizations, which then only reconcile what webhooks have missed.
+    Webhooks require the index of events, see check_targeted(). Anyone who
+    can reach the address can trigger synchronizations, thus an address
+    other than loopback requires `webhook_secret`.
+
+    Args:
+        parameters: parameters of main()
+        interval: seconds between two synchronizations
+        jitter: maximum random shift of each interval in seconds
+        webhook: optional, (host, port) on which webhooks are received
+
+    Raises:
+        ValueError: if webhooks are received on an address other than
+            loopback without `webhook_secret`
+    """
+    from webhook_receiver import ChangeQueue, WebhookReceiver, is_loopback
+
+    if webhook:
+        check_targeted(parameters)
+        if not parameters.get('webhook_secret') and not is_loopback(webhook[0]):
+            raise ValueError('webhook_secret is required to receive webhooks on '
+                             '{}'.format(webhook[0] or 'all interfaces'))
+    stop = threading.Event()
+    queue = ChangeQueue(parameters.get('webhook_debounce', 5),
+                        parameters.get('webhook_max_delay', 60)) if webhook else None
+
+    def request_stop(signum, frame):
+        print('Signal %d received, stopping after the current synchronization' % signum)
+        stop.set()
+        if queue is not None:
+            queue.close()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    context = create_context(parameters)
+    receiver = WebhookReceiver(queue, webhook[0], webhook[1],
+                               parameters.get('webhook_secret')).start() if webhook else None
+    try:
+        serve(parameters, context, stop, interval, jitter, queue)
+    finally:
+        if receiver is not None:
+            receiver.stop()
+        close_context(context)
 
-    # Read and parse work packages from OpenProject
+
+def serve(parameters, context, stop, interval=600, jitter=60, queue=None):
+    """Synchronizes periodically, and changes of the queue in between.
+
+    Args:
+        parameters: parameters of main()
+        context: sessions and services returned from create_context()
+        stop: threading.Event that stops serving after the current
+            synchronization, `queue` should be closed too when it is set
+        interval: seconds between two synchronizations of everything
+        jitter: maximum random shift of each interval in seconds
+        queue: optional webhook_receiver.ChangeQueue of changed work packages
+    """
+    next_run = time.monotonic()
+    while not stop.is_set():
+        if time.monotonic() >= next_run:
+            run_safely(parameters, context)
+            next_run = time.monotonic() + max(0, interval + random.uniform(-jitter, jitter))
+        elif queue is None:
+            stop.wait(next_run - time.monotonic())
+        else:
+            changes = queue.take(next_run - time.monotonic())
+            if changes:
+                run_safely(parameters, context, changes)
+
+
+def run_safely(parameters, context, wp_ids=None):
+    """Refreshes the access token and runs, an error is printed, not raised"""
+    try:
+        sync.refresh_credentials(context['credentials'], cache=context['token_cache'])
+        run(parameters, context, wp_ids)
+    except Exception as error:  # Try again in the next interval
+        print('Synchronization has failed at %s: %r'
+              %(datetime.today().isoformat(), error))
+
+
+def create_context(parameters):
+    """Creates sessions, services and state shared by synchronizations.
+
+    Returns:
+        context: a dictionary of OpenProject `session`, `openproject_cache`,
+            `store`, `credentials`, `token_cache`, `google_http`,
+            `calendar_service`, `sheet_service`, `limiter`, `log_sink`,
+            `metrics` and `log_flush_timeout`
+    """
+    # The state of a calendar is kept for a single project
+    if parameters.get('state_file'):
+        check_calendars(project_pairs(parameters))
+    # Measurements of each run, requests of the services are counted in it
+    metrics = RunMetrics(parameters.get('profile_phase'),
+                         parameters.get('profile_file', 'profile.prof'))
+    # Unchanged responses of OpenProject are reused from the previous runs
+    openproject_cache = ResponseCache(
+        parameters['openproject_cache_file'],
+        parameters.get('openproject_cache_size', 100) * 2**20) \
+        if parameters.get('openproject_cache_file') else None
     # Initilize and Authorize OpenProject session
-    session = sync.openproject_session(api_key)
+    session = sync.openproject_session(parameters['openproject_api_key'],
+                                       openproject_cache)
+    session.hooks['response'].append(metrics.openproject_hook)
+    # Local state of the previous runs, if it is kept
+    store = StateStore(parameters['state_file']) \
+        if parameters.get('state_file') else None
+    # Load service account credentials
+    credentials = sync.load_credentials(parameters['path_to_secret_file'],
+                                        parameters['SCOPES'])
+    # Reuse the access token of a previous run while it is valid
+    token_cache = TokenCache(parameters['token_cache_file']) \
+        if parameters.get('token_cache_file') else None
+    if token_cache is not None:
+        sync.refresh_credentials(credentials, cache=token_cache)
+    # create calendar and sheet services from cached discovery documents,
+    # sheet service is not created, and not even imported, if not required.
+    # Both services share a pool of connections to Google
+    from transport import PooledHttp
+    google_http = PooledHttp(credentials, parameters.get('http_pool_size', 10),
+                             parameters.get('http_timeout', 60),
+                             metrics.google_observer)
+    cache_dir = parameters.get('discovery_cache_dir', sync.DISCOVERY_CACHE_DIR)
+    calendar_service = sync.google_calendar_service(credentials, cache_dir,
+                                                    http=google_http)
+    sheet_service = sync.google_sheet_service(credentials, cache_dir,
+                                              http=google_http) \
+        if parameters['save_logs'] else None
+    # Pace calendar calls to stay within the quota of Calendar API, the quota
+    # is per user, thus the limiter is shared by all projects
+    limiter = sync.RateLimiter(parameters['requests_per_second']) \
+        if parameters.get('requests_per_second') else None
+    # Logs are kept locally, and flushed to the sheet if 'save_logs' is True
+    log_dir = parameters.get('log_dir') or ('logs' if parameters['save_logs'] else None)
+    log_sink = LogSink(log_dir, max_rows=parameters.get('log_rows_per_page', 10000)) \
+        if log_dir else None
+
+    return {'session': session, 'openproject_cache': openproject_cache,
+            'store': store, 'credentials': credentials,
+            'token_cache': token_cache, 'google_http': google_http,
+            'calendar_service': calendar_service, 'sheet_service': sheet_service,
+            'limiter': limiter, 'log_sink': log_sink, 'metrics': metrics,
+            'log_flush_timeout': parameters.get('log_flush_timeout', 60)}
+
 
-    # Get project ID
-    projects = sync.get_projects_and_ids(session, url)
+def check_targeted(parameters):
+    """Rejects synchronizing given work packages without the index of events.
+
+    Given work packages are synchronized without listing the calendar, thus
+    their events are found in the index of events. Events created by older
+    versions have ids chosen by Google, an event that is looked up by the
+    id derived from its work package is not found and would be duplicated.
+
+    Raises:
+        ValueError: if 'state_file' or 'use_event_index' is not given
+    """
+    if not (parameters.get('state_file') and parameters.get('use_event_index')):
+        raise ValueError('Synchronizing given work packages requires state_file '
+                         'and use_event_index')
+
+
+def project_pairs(parameters):
+    """Returns the projects and the calendars that they are synchronized to"""
+    return parameters.get('projects') or \
+        [{'project_name': parameters['project_name'],
+          'calendar_id': parameters.get('calendar_id'),
+          'assignee_calendars': parameters.get('assignee_calendars')}]
+
+
+def check_calendars(pairs):
+    """Rejects a calendar that receives the work packages of several pairs.
+
+    The state store keeps the sync token, journal and index of events of a
+    calendar, not of a project. If two projects are synchronized to the same
+    calendar, each of them would take the events of the other as its own
+    and delete them on every run.
+
+    Raises:
+        ValueError: if a calendar is used by more than one pair
+    """
+    owners = {}
+    for pair in pairs:
+        calendars = set((pair.get('assignee_calendars') or {}).values())
+        calendars.add(pair.get('calendar_id'))
+        calendars.discard(None)
+        for calendar_id in calendars:
+            if calendar_id in owners:
+                raise ValueError('Calendar {} is used by both {} and {}, a calendar '
+                                 'should receive a single project if state_file '
+                                 'is given'.format(calendar_id, owners[calendar_id],
+                                                   pair['project_name']))
+            owners[calendar_id] = pair['project_name']
+
+
+def close_context(context):
+    """Closes sessions and state created by create_context().
+
+    Waits for the logs being flushed to the sheet, at most `log_flush_timeout`
+    seconds. Logs that are not flushed yet are flushed by the next run.
+    """
+    if context['log_sink'] is not None:
+        context['log_sink'].wait(context['log_flush_timeout'])
+    context['session'].close()
+    if context['openproject_cache'] is not None:
+        context['openproject_cache'].close()
+    context['google_http'].close()
+    if context['store'] is not None:
+        context['store'].close()
+
+
+def run(parameters, context, wp_ids=None):
+    """Synchronizes each project once with sessions and services of context.
+
+    Measurements of the run are written to `run_report` and `metrics_file`
+    if they are given. Sheets calls of the background flush of logs are
+    counted in the next run. If `wp_ids` are given, only those work packages
+    are synchronized, see synchronize_selected(). They can be a dictionary
+    of wp IDs of each project ID, e.g. from webhook_receiver.ChangeQueue,
+    then only those projects are synchronized. IDs under the None key are
+    synchronized in every project.
+    """
+    metrics = context['metrics']
+    metrics.start()
+    # Projects and calendars that they are synchronized to
+    pairs = project_pairs(parameters)
+    # Get project IDs, memoized for `projects_ttl` seconds if they are cached
+    ttl = parameters.get('projects_ttl', sync.PROJECTS_TTL)
+    projects = sync.get_projects_and_ids(context['session'],
+                                         parameters['openproject_api_url'],
+                                         context['openproject_cache'], ttl)
+    if context['openproject_cache'] is not None and \
+            any(pair['project_name'] not in projects for pair in pairs):
+        # A project is added or renamed after the projects are memoized
+        projects = sync.get_projects_and_ids(context['session'],
+                                             parameters['openproject_api_url'],
+                                             context['openproject_cache'], 0)
+
+    label_projects = len(pairs) > 1
+    if isinstance(wp_ids, dict):  # Changed work packages of each project
+        selected = {}
+        for pair in pairs:
+            project_id = projects.get(pair['project_name'])
+            selected[pair['project_name']] = set(wp_ids.get(project_id, ())) | \
+                set(wp_ids.get(None, ()))
+        pairs = [pair for pair in pairs if selected[pair['project_name']]]
+    elif wp_ids:
+        selected = {pair['project_name']: wp_ids for pair in pairs}
+
+    # Synchronize each project in parallel
+    with ThreadPoolExecutor(parameters.get('max_parallel_projects', 4)) as executor:
+        if wp_ids:
+            futures = [executor.submit(synchronize_selected, parameters,
+                                       projects, pair['project_name'],
+                                       pair.get('calendar_id'), context['session'],
+                                       context['calendar_service'],
+                                       sorted(selected[pair['project_name']]),
+                                       context['store'], context['limiter'], metrics,
+                                       pair.get('assignee_calendars'))
+                       for pair in pairs]
+        else:
+            futures = [executor.submit(synchronize_project, parameters,
+                                       projects, pair['project_name'],
+                                       pair.get('calendar_id'), context['session'],
+                                       context['calendar_service'], context['store'],
+                                       context['limiter'], metrics,
+                                       pair.get('assignee_calendars'))
+                       for pair in pairs]
+    results = []
+    for pair, future in zip(pairs, futures):
+        try:
+            results.append((pair, future.result(), None))
+        except Exception as error:  # Others continue even if one fails
+            results.append((pair, None, repr(error)))
+
+    for pair, _, error in results:
+        metrics.record_project(error is None)
+        if error is not None:
+            print('Synchronization of %s has failed: %s' %(pair['project_name'], error))
+
+    with metrics.phase('save_logs'):
+        save_logs(parameters, context, results, label_projects)
+    metrics.finish(parameters.get('run_report'), parameters.get('metrics_file'))
+
+    print('Synchronization has been completed at %s!' %datetime.today().isoformat())
+
+
+def save_logs(parameters, context, results, label_projects):
+    """Saves logs of the projects locally and starts flushing them to the sheet"""
+    if context['log_sink'] is not None:
+        # save logs of each project locally
+        for pair, result, error in results:
+            label = pair['project_name'] if error is None else \
+                '{} failed: {}'.format(pair['project_name'], error)
+            wps, errors = result or ([set(), set(), set()], [[], [], []])
+            context['log_sink'].write(wps, errors,
+                                      label if label_projects or error else None)
+    if parameters['save_logs']:
+        # Logs are flushed to the sheet without delaying synchronization
+        context['log_sink'].flush_in_background(context['sheet_service'],
+                                                parameters['sheet_id'])
+
+
+def synchronize_project(parameters, projects, project_name, calendar_id,
+                        session, calendar_service, store=None, limiter=None,
+                        metrics=None, assignee_calendars=None):
+    """Synchronizes work packages of a project with a calendar.
+
+    If `assignee_calendars` are given, work packages are read and parsed
+    once and routed to the calendars of their assignees, see
+    synchronization.route_workpackages(). Calendars are synchronized in
+    parallel, at most `max_parallel_calendars` of them at the same time. If
+    one of them fails, the others are not affected.
+
+    Args:
+        parameters: parameters of main()
+        projects: project names and ids returned from get_projects_and_ids()
+        project_name: name of the project on OpenProject
+        calendar_id: Calendar ID of Google Calendar, the calendar of work
+            packages whose assignees are not routed. If it is None, they are
+            not synchronized.
+        session: Authorized OpenProject session
+        calendar_service: Google API service built with Calendar scope
+        store: optional state_store.StateStore
+        limiter: optional synchronization.RateLimiter
+        metrics: optional instrumentation.RunMetrics that records the time
+            of each phase
+        assignee_calendars: optional, a dictionary of calendar IDs whose keys
+            are assignees
+
+    Returns:
+        wps: classified wp_ids as create, delete or update
+        errors: Faced errors during creation, deletion or update
+    """
+    url = parameters['openproject_api_url']
     project_id = projects[project_name]
+    metrics = metrics or RunMetrics()
 
-    # Read work packages in json structre
-    all_work_packages = sync.read_workpackages(session, url, project_id=project_id)
+    # Read work packages in json structre, only the changed ones if possible,
+    # pages that are read while parsing are measured as reading too
+    page_size = parameters.get('page_size', 100)
+    select = sync.WORK_PACKAGE_SELECT if parameters.get('select_fields', True) else None
+    # Synchronize only the window around today if it is configured
+    window, shard_days = sync_window(parameters)
+    with metrics.phase('read_workpackages'):
+        if store is not None:
+            all_work_packages = sync.read_changed_workpackages(
+                session, url, project_id, store, page_size, select=select,
+                window=window, shard_days=shard_days)
+        else:
+            all_work_packages = sync.read_workpackages(
+                session, url, project_id, page_size, select=select,
+                shards=None if window is None else sync.window_filters(window, shard_days))
+    all_work_packages = metrics.timed(all_work_packages, 'read_workpackages')
     # Parse work packages into predetermined structure
-    parsed_wps, op_err = sync.parse_workpackages(all_work_packages)
+    with metrics.phase('parse_workpackages'):
+        parsed_wps, op_err = sync.parse_workpackages(all_work_packages, project_id)
 
-    # Load service account credentials
-    credentials = sync.load_credentials(secret_file, scopes)
-    # create calendar service
-    calendar_service = sync.google_calendar_service(credentials)
-    # Read events from calendar
-    all_events = sync.read_events(calendar_service, calendar_id)
-    # Parse events
-    parsed_events, gc_err = sync.parse_events(all_events)
+    if not assignee_calendars:
+        return synchronize_calendar(parameters, project_id, calendar_id, parsed_wps,
+                                    calendar_service, store, limiter, metrics,
+                                    window, shard_days)
+
+    # Synchronize the work packages of each assignee with their calendar
+    groups = sync.route_workpackages(parsed_wps, assignee_calendars, calendar_id)
+    with ThreadPoolExecutor(parameters.get('max_parallel_calendars', 4)) as executor:
+        futures = {routed_calendar: executor.submit(
+            synchronize_calendar, parameters, project_id, routed_calendar,
+            routed_wps, calendar_service, store, limiter, metrics, window,
+            shard_days) for routed_calendar, routed_wps in groups.items()}
+
+    return merge_results(project_name, futures)
+
+
+def synchronize_calendar(parameters, project_id, calendar_id, parsed_wps,
+                         calendar_service, store=None, limiter=None, metrics=None,
+                         window=None, shard_days=None):
+    """Synchronizes parsed work packages with the events of a calendar.
+
+    Unfinished calendar calls of an interrupted run are replayed first, see
+    replay_journal().
+
+    Args:
+        parameters: parameters of main()
+        project_id: ID of the project of the work packages
+        calendar_id: Calendar ID of Google Calendar
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
+        calendar_service: Google API service built with Calendar scope
+        store: optional state_store.StateStore
+        limiter: optional synchronization.RateLimiter
+        metrics: optional instrumentation.RunMetrics
+        window: optional, window of the synchronization as returned from
+            synchronization.time_window()
+        shard_days: if given, the window is read in shards of this many days
+
+    Returns:
+        wps: classified wp_ids as create, delete or update
+        errors: Faced errors during creation, deletion or update
+    """
+    metrics = metrics or RunMetrics()
+    use_index = store is not None and parameters.get('use_event_index')
+    replay_journal(parameters, calendar_id, calendar_service, store, limiter, metrics)
+    # Use the local index of events instead of reading the calendar if enabled
+    if use_index:
+        with metrics.phase('read_events'):
+            parsed_events, gc_err = sync.read_indexed_events(
+                calendar_service, calendar_id, store,
+                parameters.get('reconcile_interval', 86400),
+                window=window, shard_days=shard_days, project_id=project_id)
+    else:
+        # Read events from calendar
+        with metrics.phase('read_events'):
+            all_events = sync.read_events(calendar_service, calendar_id, store=store,
+                                          window=window, shard_days=shard_days,
+                                          project_id=project_id)
+        # Parse events
+        with metrics.phase('parse_events'):
+            parsed_events, gc_err = sync.parse_events(all_events, project_id)
     # SYNCHRONIZE!
-    wps, errors = sync.synchronize_wps(parsed_wps,
-                                       parsed_events,
-                                       calendar_service,
-                                       calendar_id)
+    with metrics.phase('synchronize_wps'):
+        wps, errors = sync.synchronize_wps(parsed_wps,
+                                           parsed_events,
+                                           calendar_service,
+                                           calendar_id,
+                                           parameters.get('batch_size'),
+                                           parameters.get('max_workers'),
+                                           limiter,
+                                           parameters.get('max_retries', 0),
+                                           store if use_index else None,
+                                           metrics,
+                                           window,
+                                           store)
 
-    if parameters['save_logs']:
-        # Create sheet service
-        sheet_id = parameters['sheet_id']
-        sheet_service = sync.google_sheet_service(credentials)
-        # save logs
-        sync.save_logs(wps, errors, sheet_service, sheet_id)
+    return wps, errors
 
-    print('Synchronization has been completed at %s!' %datetime.today().isoformat())
+
+def sync_window(parameters):
+    """Returns the window of synchronization, None if it is not configured,
+    and the number of days of its shards"""
+    window = None
+    if 'window_past_days' in parameters or 'window_future_days' in parameters:
+        window = sync.time_window(parameters.get('window_past_days', 30),
+                                  parameters.get('window_future_days', 365))
+
+    return window, parameters.get('window_shard_days', 90)
+
+
+def merge_results(project_name, futures):
+    """Merges the results of the calendars of a project into one.
+
+    Calendars that have failed are reported and left out, so that the
+    results of the others are still logged.
+
+    Args:
+        project_name: name of the project on OpenProject
+        futures: a dictionary of futures of synchronize_calendar(), keys
+            are calendar IDs
+
+    Returns:
+        wps: classified wp_ids as create, delete or update
+        errors: Faced errors during creation, deletion or update
+    """
+    wps, errors = [set(), set(), set()], [[], [], []]
+    for calendar_id, future in futures.items():
+        try:
+            calendar_wps, calendar_errors = future.result()
+        except Exception as error:  # Others continue even if one fails
+            print('Synchronization of %s to %s has failed: %r' %(project_name,
+                                                                calendar_id, error))
+            continue
+        for merged, ids in zip(wps, calendar_wps):
+            merged.update(ids)
+        for merged, errs in zip(errors, calendar_errors):
+            merged.extend(errs)
+
+    return wps, errors
+
+
+def synchronize_selected(parameters, projects, project_name, calendar_id,
+                         session, calendar_service, wp_ids, store=None,
+                         limiter=None, metrics=None, assignee_calendars=None):
+    """Synchronizes only the given work packages of a project.
+
+    The calendar is not listed. Events are addressed by their ids in the
+    index of events, or by the ids derived from their work packages if they
+    are not in the index, see synchronization.addressed_events(). If the
+    index has never been built, the calendar is read once to build it. Given
+    work packages that are not open, or are not in the project, are removed
+    from the calendar. If a window is configured, given work packages outside
+    of it are not synchronized, and their events in it are removed as in
+    synchronize_project().
+
+    If `assignee_calendars` are given, work packages are routed to the
+    calendars of their assignees, and removed from the other calendars,
+    since they might have been assigned to someone else. If the index of
+    events is used, they are removed only from the calendars that have them.
+
+    Args:
+        parameters: parameters of main()
+        projects: project names and ids returned from get_projects_and_ids()
+        project_name: name of the project on OpenProject
+        calendar_id: Calendar ID of Google Calendar, the calendar of work
+            packages whose assignees are not routed
+        session: Authorized OpenProject session
+        calendar_service: Google API service built with Calendar scope
+        wp_ids: IDs of the work packages to synchronize
+        store: optional state_store.StateStore
+        limiter: optional synchronization.RateLimiter
+        metrics: optional instrumentation.RunMetrics
+        assignee_calendars: optional, a dictionary of calendar IDs whose keys
+            are assignees
+
+    Returns:
+        wps: classified wp_ids as create, delete or update
+        errors: Faced errors during creation, deletion or update
+    """
+    url = parameters['openproject_api_url']
+    project_id = projects[project_name]
+    metrics = metrics or RunMetrics()
+
+    # Read the open ones of the work packages, only in the window if any
+    select = sync.WORK_PACKAGE_SELECT if parameters.get('select_fields', True) else None
+    window, shard_days = sync_window(parameters)
+    id_filter = {'id': {'operator': '=', 'values': [str(wp_id) for wp_id in wp_ids]}}
+    with metrics.phase('read_workpackages'):
+        work_packages = sync.read_workpackages(
+            session, url, project_id, parameters.get('page_size', 100),
+            params={'filters': json.dumps([sync.OPEN_FILTER, id_filter])},
+            select=select,
+            shards=None if window is None else sync.window_filters(window))
+    work_packages = metrics.timed(work_packages, 'read_workpackages')
+    with metrics.phase('parse_workpackages'):
+        parsed_wps, _ = sync.parse_workpackages(work_packages, project_id)
+
+    if not assignee_calendars:
+        return synchronize_addressed(parameters, project_id, calendar_id, parsed_wps,
+                                     set(wp_ids) - set(parsed_wps), calendar_service,
+                                     store, limiter, metrics, window=window,
+                                     shard_days=shard_days)
+
+    groups = sync.route_workpackages(parsed_wps, assignee_calendars, calendar_id)
+    with ThreadPoolExecutor(parameters.get('max_parallel_calendars', 4)) as executor:
+        futures = {routed_calendar: executor.submit(
+            synchronize_addressed, parameters, project_id, routed_calendar,
+            routed_wps, set(wp_ids) - set(routed_wps), calendar_service, store,
+            limiter, metrics, True, window, shard_days)
+            for routed_calendar, routed_wps in groups.items()}
+
+    return merge_results(project_name, futures)
+
+
+def synchronize_addressed(parameters, project_id, calendar_id, parsed_wps,
+                          removed_wp_ids, calendar_service, store=None, limiter=None,
+                          metrics=None, known_only=False, window=None, shard_days=None):
+    """Synchronizes given work packages with a calendar without listing it.
+
+    Args:
+        parameters: parameters of main()
+        project_id: ID of the project of the work packages
+        calendar_id: Calendar ID of Google Calendar
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
+        removed_wp_ids: IDs of the work packages removed from the calendar
+        calendar_service: Google API service built with Calendar scope
+        store: optional state_store.StateStore
+        limiter: optional synchronization.RateLimiter
+        metrics: optional instrumentation.RunMetrics
+        known_only: whether only the removed work packages in the index of
+            events are removed, if the index is used
+        window: optional, window of the synchronization as returned from
+            synchronization.time_window(), events outside of it are not
+            deleted
+        shard_days: if given, the window is read in shards of this many days
+            when the index is built
+
+    Returns:
+        wps: classified wp_ids as create, delete or update
+        errors: Faced errors during creation, deletion or update
+    """
+    metrics = metrics or RunMetrics()
+    use_index = store is not None and parameters.get('use_event_index')
+    replay_journal(parameters, calendar_id, calendar_service, store, limiter, metrics)
+    with metrics.phase('read_events'):
+        # The index is built from the calendar if it has never been
+        known_events = sync.read_indexed_events(
+            calendar_service, calendar_id, store, float('inf'), window=window,
+            shard_days=shard_days, project_id=project_id)[0] if use_index else None
+        if use_index and known_only:
+            removed_wp_ids = set(removed_wp_ids).intersection(known_events)
+        parsed_events = sync.addressed_events(parsed_wps, removed_wp_ids,
+                                              project_id, known_events)
+    with metrics.phase('synchronize_wps'):
+        return sync.synchronize_wps(parsed_wps, parsed_events, calendar_service,
+                                    calendar_id, parameters.get('batch_size'),
+                                    parameters.get('max_workers'), limiter,
+                                    parameters.get('max_retries', 0),
+                                    store if use_index else None, metrics,
+                                    window, store)
+
+
+def replay_journal(parameters, calendar_id, calendar_service, store=None,
+                   limiter=None, metrics=None):
+    """Finishes the calendar calls of an interrupted run, if a state is kept"""
+    if store is None:
+        return
+    metrics = metrics or RunMetrics()
+    use_index = parameters.get('use_event_index')
+    with metrics.phase('replay_journal'):
+        replayed, errors = sync.replay_journal(
+            calendar_service, calendar_id, store, store if use_index else None,
+            parameters.get('batch_size'), parameters.get('max_workers'),
+            limiter, parameters.get('max_retries', 0), metrics)
+    if replayed:
+        print('{} interrupted calendar calls are replayed, {} failed'.format(
+            len(replayed), sum(error is not None for error in errors)))
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(
+        description='Synchronizes OpenProject tasks with Google Calendar.')
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and synchronize periodically')
+    parser.add_argument('--interval', type=float, default=600,
+                        help='seconds between synchronizations in daemon mode')
+    parser.add_argument('--jitter', type=float, default=60,
+                        help='maximum random shift of the interval in seconds')
+    parser.add_argument('--work-packages', type=int, nargs='+', metavar='ID',
+                        help='synchronize only these work packages once')
+    parser.add_argument('--webhook', metavar='[HOST:]PORT',
+                        help='in daemon mode, also synchronize work packages when '
+                             'OpenProject calls the webhook on this address')
+    args = parser.parse_args()
+
     # Before synchronization, you have to add your service account to your
     # calendar and sheet as an editor. If you do not add your account as an editor
     # authorization can not be performed.
@@ -112,7 +815,37 @@ if __name__ == "__main__":
         'openproject_api_key': 'your_open_project_api_key',
         'project_name': 'your_projet_name',
         'save_logs': False,
-        'sheet_id': 'your_google_sheet_id'
+        'sheet_id': 'your_google_sheet_id',
+        # To synchronize several projects, list them instead
+        # 'projects': [{'project_name': 'your_projet_name',
+        #               'calendar_id': 'your_google_calendar_id'}],
+        # To synchronize work packages of each assignee with their own calendar
+        # 'assignee_calendars': {'Jane Doe': 'calendar_id_of_jane',
+        #                        'John Doe': 'calendar_id_of_john'},
+        'state_file': 'sync_state.sqlite3',
+        'openproject_cache_file': 'openproject_cache.sqlite3',
+        'token_cache_file': 'token_cache.json',
+        'window_past_days': 30,
+        'window_future_days': 365,
+        'batch_size': 50,
+        'max_workers': 4,
+        'requests_per_second': 5,
+        'max_retries': 5,
+        'use_event_index': True,
+        'reconcile_interval': 24 * 60 * 60,
+        'run_report': 'run_report.json',
+        # To expose measurements of each run to Prometheus
+        # 'metrics_file': '/var/lib/node_exporter/textfile_collector/op2gc.prom',
+        # Secret of the webhook on OpenProject, required if --webhook listens
+        # on an address other than loopback
+        # 'webhook_secret': 'your_webhook_secret',
         }
 
-    main(required_parameters)
+    if args.daemon:
+        webhook = None
+        if args.webhook:
+            host, _, port = args.webhook.rpartition(':')
+            webhook = (host or '127.0.0.1', int(port))
+        daemon(required_parameters, args.interval, args.jitter, webhook)
+    else:
+        main(required_parameters, args.work_packages)
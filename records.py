@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact records of parsed work packages and events, and of the operations
+in the journal of synchronization.
+
+Large projects have tens of thousands of work packages and events, and each
+of them used to be parsed into a dictionary. Records keep their fields in
+`__slots__` instead, which takes a fraction of the memory of a dictionary
+and is faster to access. Fields are read as attributes, e.g. `wp.subject`.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+
+
+class Record:
+    """Base of records, fields are listed in `__slots__` of subclasses"""
+    __slots__ = ()
+
+    def as_dict(self):
+        """Returns fields of the record as a dictionary"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in self.__slots__))
+
+
+class WorkPackageRecord(Record):
+    """A work package of OpenProject as it is synchronized to the calendar.
+
+    Args:
+        wp_id: ID of the work package
+        subject: subject without surrounding whitespace
+        description: description in HTML
+        parent: "ID:subject" of the parent, or "No parent"
+        assignee: name of the assignee, or "Not assigned to anyone"
+        due_date: YYYY-MM-DD, date of creation if there is no due date
+        due_hour: HH:MM:SS, "dueHour" at the end of the description
+        updated_at: `updatedAt` of the work package
+        project_id: ID of the project if it is known, the id of the event
+            of the work package is derived from it
+    """
+    __slots__ = ('wp_id', 'subject', 'description', 'parent', 'assignee',
+                 'due_date', 'due_hour', 'updated_at', 'project_id')
+
+    def __init__(self, wp_id, subject, description, parent, assignee,
+                 due_date, due_hour, updated_at, project_id=None):
+        self.wp_id = wp_id
+        self.subject = subject
+        self.description = description
+        self.parent = parent
+        self.assignee = assignee
+        self.due_date = due_date
+        self.due_hour = due_hour
+        self.updated_at = updated_at
+        self.project_id = project_id
+
+
+class EventRecord(Record):
+    """An event on the calendar that represents a work package.
+
+    Events read from the local index of events do not have `assignee` and
+    `due_hour`, they are None. Their `due_date` is None if it is unknown.
+
+    Args:
+        wp_id: ID of the work package that the event represents
+        event_id: ID of the event, required to update and delete it
+        subject: subject of the work package in the summary of the event
+        updated_at: `updatedAt` of the work package when it was synchronized,
+            None if the event has been changed since
+        content_hash: hash of the synchronized fields of the event
+        field_hashes: a dictionary of hashes of each synchronized field
+        assignee: assignee written in the description of the event, None
+            for events tagged in their extended properties
+        due_date: YYYY-MM-DD, date of the end of the event
+        due_hour: time of the end of the event
+    """
+    __slots__ = ('wp_id', 'event_id', 'subject', 'updated_at', 'content_hash',
+                 'field_hashes', 'assignee', 'due_date', 'due_hour')
+
+    def __init__(self, wp_id, event_id, subject, updated_at, content_hash,
+                 field_hashes=None, assignee=None, due_date=None, due_hour=None):
+        self.wp_id = wp_id
+        self.event_id = event_id
+        self.subject = subject
+        self.updated_at = updated_at
+        self.content_hash = content_hash
+        self.field_hashes = field_hashes
+        self.assignee = assignee
+        self.due_date = due_date
+        self.due_hour = due_hour
+
+
+class JournalEntry(Record):
+    """An operation on the calendar written to the journal before it runs.
+
+    Args:
+        wp_id: ID of the work package that the operation synchronizes
+        action: 'create', 'delete' or 'update'
+        event_id: ID of the deleted or updated event, None for 'create'
+        body: json body of the request, None for 'delete'. Inserted events
+            carry their ids in the body.
+        subject: subject of the work package, saved to the index of events
+        updated_at: `updatedAt` of the work package, saved to the index
+        response: response of the request if the operation has completed,
+            otherwise None
+    """
+    __slots__ = ('wp_id', 'action', 'event_id', 'body', 'subject', 'updated_at',
+                 'response')
+
+    def __init__(self, wp_id, action, event_id, body, subject, updated_at,
+                 response=None):
+        self.wp_id = wp_id
+        self.action = action
+        self.event_id = event_id
+        self.body = body
+        self.subject = subject
+        self.updated_at = updated_at
+        self.response = response
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local state of the synchronization that persists between consecutive runs.
+
+Reading everything from OpenProject and Google Calendar on every run is costly
+for large projects and calendars. The state store keeps what is learned during
+a run in a SQLite database, e.g. the sync token of a calendar and the events
+read with it, or the work packages of a project and their `updatedAt`
+watermark. Thus, the next run only asks for what has changed since.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id)
+);
+CREATE TABLE IF NOT EXISTS work_packages (
+    project_id INTEGER NOT NULL,
+    wp_id INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (project_id, wp_id)
+);
+CREATE TABLE IF NOT EXISTS event_index (
+    calendar_id TEXT NOT NULL,
+    wp_id INTEGER NOT NULL,
+    event_id TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    field_hashes TEXT NOT NULL DEFAULT '{}',
+    due_date TEXT,
+    PRIMARY KEY (calendar_id, wp_id)
+);
+CREATE TABLE IF NOT EXISTS journal (
+    calendar_id TEXT NOT NULL,
+    wp_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    event_id TEXT,
+    body TEXT,
+    subject TEXT,
+    updated_at TEXT,
+    response TEXT,
+    PRIMARY KEY (calendar_id, wp_id)
+);
+"""
+INDEX_COLUMNS = ('wp_id', 'event_id', 'subject', 'updated_at', 'content_hash',
+                 'field_hashes', 'due_date')
+JOURNAL_COLUMNS = ('wp_id', 'action', 'event_id', 'body', 'subject', 'updated_at',
+                   'response')
+
+
+def migrate(connection):
+    """Adds the columns introduced later to the tables of an older database"""
+    columns = {row[1] for row in connection.execute('PRAGMA table_info(event_index)')}
+    if 'field_hashes' not in columns:
+        connection.execute("ALTER TABLE event_index "
+                           "ADD COLUMN field_hashes TEXT NOT NULL DEFAULT '{}'")
+    if 'due_date' not in columns:
+        connection.execute("ALTER TABLE event_index ADD COLUMN due_date TEXT")
+
+
+class StateStore:
+    """Keeps the synchronization state in a SQLite database.
+
+    Values are saved as json, thus anything json serializable can be stored.
+    A single connection is shared by all threads of the process and guarded
+    with a lock. Several processes may use the same file, SQLite serializes
+    their writes. The database is kept in write-ahead log mode, in which a
+    commit does not wait for the disk, thus frequent small writes such as
+    marking operations of the journal complete are cheap.
+
+    Args:
+        path: path to the SQLite database file, created if it does not exist
+    """
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, timeout=30,
+                                           check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+            migrate(self._connection)
+
+    def get(self, key, default=None):
+        """Returns the value saved with `key`, or `default` if there is none"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key, value):
+        """Saves `value` with `key`, replaces the previous value if any"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                (key, json.dumps(value)))
+
+    def delete(self, key):
+        """Removes the value saved with `key`"""
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM state WHERE key = ?', (key,))
+
+    def load_events(self, calendar_id):
+        """Returns the events of the calendar saved by the previous runs"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT body FROM events WHERE calendar_id = ?',
+                (calendar_id,)).fetchall()
+
+        return [json.loads(row[0]) for row in rows]
+
+    def save_events(self, calendar_id, events, replace=False):
+        """Saves changed events of the calendar.
+
+        Cancelled events are removed, the others are inserted or replaced.
+
+        Args:
+            calendar_id: Calendar ID of Google Calendar
+            events: changed events as returned from the Calendar API
+            replace: if True, previously saved events of calendar are dropped
+        """
+        with self._lock, self._connection:
+            if replace:
+                self._connection.execute(
+                    'DELETE FROM events WHERE calendar_id = ?', (calendar_id,))
+            for event in events:
+                if event.get('status') == 'cancelled':
+                    self._connection.execute(
+                        'DELETE FROM events WHERE calendar_id = ? AND event_id = ?',
+                        (calendar_id, event['id']))
+                else:
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO events VALUES (?, ?, ?)',
+                        (calendar_id, event['id'], json.dumps(event)))
+
+    def iter_work_packages(self, project_id, chunk_size=500):
+        """Yields the work packages of the project saved by the previous runs.
+
+        Work packages are read in chunks of `chunk_size`, thus the whole
+        project is never loaded into memory at once.
+        """
+        last_rowid = 0
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    'SELECT rowid, body FROM work_packages '
+                    'WHERE project_id = ? AND rowid > ? ORDER BY rowid LIMIT ?',
+                    (project_id, last_rowid, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            for _, body in rows:
+                yield json.loads(body)
+
+    def work_package_ids(self, project_id):
+        """Returns the set of ids of the saved work packages of the project"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT wp_id FROM work_packages WHERE project_id = ?',
+                (project_id,)).fetchall()
+
+        return {row[0] for row in rows}
+
+    def save_work_packages(self, project_id, work_packages, replace=False):
+        """Saves work packages of the project, replaces the previous versions.
+
+        Args:
+            project_id: ID of the project on OpenProject
+            work_packages: work package elements in json structure
+            replace: if True, previously saved work packages are dropped
+        """
+        with self._lock, self._connection:
+            if replace:
+                self._connection.execute(
+                    'DELETE FROM work_packages WHERE project_id = ?', (project_id,))
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO work_packages VALUES (?, ?, ?)',
+                ((project_id, elem['id'], json.dumps(elem)) for elem in work_packages))
+
+    def delete_work_packages(self, project_id, wp_ids):
+        """Removes work packages with given ids of the project"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM work_packages WHERE project_id = ? AND wp_id = ?',
+                ((project_id, wp_id) for wp_id in wp_ids))
+
+    def load_index(self, calendar_id):
+        """Returns the index of events synchronized to the calendar.
+
+        Returns:
+            index: a dictionary of index entries, key is wp ID. Each entry has
+                `wp_id`, `event_id`, `subject`, `updated_at`, `content_hash`,
+                `field_hashes` and `due_date`, which is None if it is unknown.
+                `updated_at` is None if the event has changed on the calendar.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT {} FROM event_index WHERE calendar_id = ?'.format(
+                    ', '.join(INDEX_COLUMNS)), (calendar_id,)).fetchall()
+
+        index = {}
+        for row in rows:
+            entry = dict(zip(INDEX_COLUMNS, row))
+            entry['field_hashes'] = json.loads(entry['field_hashes'])
+            entry['updated_at'] = entry['updated_at'] or None  # Saved as ''
+            index[entry['wp_id']] = entry
+
+        return index
+
+    def save_index(self, calendar_id, entries, replace=False):
+        """Saves index entries of the calendar, replaces the previous ones.
+
+        Args:
+            calendar_id: Calendar ID of Google Calendar
+            entries: index entries as returned from load_index()
+            replace: if True, the previous index of the calendar is dropped
+        """
+        with self._lock, self._connection:
+            if replace:
+                self._connection.execute(
+                    'DELETE FROM event_index WHERE calendar_id = ?', (calendar_id,))
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO event_index (calendar_id, {}) '
+                'VALUES (?, {})'.format(', '.join(INDEX_COLUMNS),
+                                        ', '.join('?' * len(INDEX_COLUMNS))),
+                ((calendar_id,) + tuple(entry[key] for key in INDEX_COLUMNS[:3])
+                 + (entry['updated_at'] or '', entry['content_hash'])
+                 + (json.dumps(entry.get('field_hashes') or {}), entry.get('due_date'))
+                 for entry in entries))
+
+    def delete_index(self, calendar_id, wp_ids):
+        """Removes index entries of the calendar with given wp ids"""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM event_index WHERE calendar_id = ? AND wp_id = ?',
+                ((calendar_id, wp_id) for wp_id in wp_ids))
+
+    def write_journal(self, calendar_id, entries):
+        """Writes planned operations on the calendar to the journal.
+
+        Args:
+            calendar_id: Calendar ID of Google Calendar
+            entries: dictionaries of JOURNAL_COLUMNS except `response`, at
+                most one operation per work package
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO journal (calendar_id, {}) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, NULL)'.format(', '.join(JOURNAL_COLUMNS)),
+                ((calendar_id,) + tuple(entry[key] for key in JOURNAL_COLUMNS[:-1])
+                 for entry in entries))
+
+    def complete_journal(self, calendar_id, wp_id, response):
+        """Marks the operation of the work package complete with its response"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'UPDATE journal SET response = ? WHERE calendar_id = ? AND wp_id = ?',
+                (json.dumps(response), calendar_id, wp_id))
+
+    def load_journal(self, calendar_id):
+        """Returns the operations in the journal of the calendar.
+
+        Returns:
+            entries: a list of dictionaries of JOURNAL_COLUMNS. `response` is
+                None if the operation has not completed.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT {} FROM journal WHERE calendar_id = ?'.format(
+                    ', '.join(JOURNAL_COLUMNS)), (calendar_id,)).fetchall()
+
+        entries = [dict(zip(JOURNAL_COLUMNS, row)) for row in rows]
+        for entry in entries:
+            if entry['response'] is not None:
+                entry['response'] = json.loads(entry['response'])
+
+        return entries
+
+    def clear_journal(self, calendar_id):
+        """Removes all operations in the journal of the calendar"""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM journal WHERE calendar_id = ?', (calendar_id,))
+
+    def close(self):
+        """Closes the database connection"""
+        with self._lock:
+            self._connection.close()
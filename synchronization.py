@@ -33,27 +33,107 @@ Known Issues:
     5. Sheet may end up with "The read operation timed out" if the sheet exceeds
     a certain number of logs. This problem occurs when 918th synchronization
     has been performed. Thus, the sheet should be cleaned periodically.
-    6. All the tasks should be listed in one page on OpenProject.
+    `main` avoids this by buffering logs locally and moving on to a new page
+    of the sheet when a page gets too large, see log_sink.LogSink.
+    6. If the synchronization is limited to a window, an event that has left
+    the window is not updated anymore. If the due date of its work package
+    is moved into the window later, the event is inserted again with the id
+    derived from the work package, which updates the existing event, see
+    create_operation(). Only events created by older versions, whose ids are
+    chosen by Google, are duplicated this way.
+    7. Renaming the parent or the assignee of a work package does not change
+    its `updatedAt`. Thus, its event is updated with its next edit.
 """
+import hashlib
 import json
-from datetime import datetime, timedelta
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin
 import requests
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from http_cache import CachingAdapter
+from records import EventRecord, JournalEntry, WorkPackageRecord
+try:  # Faster json parsers are used if one of them is installed
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+# Google API client libraries are slow to import, thus they are imported in
+# the functions that use them. A run that does not need them does not pay for it.
 
 
 # Allowed length of task name for OpenProject = 255
 # Allowed length of event name for Google Calendar = unknown.
 # Event name for Google Calendar can be longer than 255
 # Created token expires in 60 min
-def get_projects_and_ids(session, url):
-    """Reads projects from OpenProject and returns project names and ids"""
+# Google API allows at most 50 calls in a batch request
+MAX_BATCH_SIZE = 50
+# Errors of Google APIs that are worth retrying after a while
+RETRIABLE_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+# Dropped connections and timeouts of the transports, also worth retrying
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, socket.timeout,
+                    requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+# Discovery documents describe Google APIs and are required to build services
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest'
+DISCOVERY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'discovery_cache')
+# Increase when the format of the cached documents changes
+DISCOVERY_CACHE_VERSION = 1
+# Only the fields that are parsed are requested, the rest of the work packages,
+# e.g. their other links and embedded resources, and of the events are not sent
+WORK_PACKAGE_SELECT = ','.join(
+    ['total', 'count', 'pageSize'] + ['elements/' + field for field in (
+        'id', 'subject', 'description', 'parent', 'assignee', 'dueDate',
+        'createdAt', 'updatedAt')])
+# Ids of events are derived from work packages, Google accepts 5 to 1024
+# characters of base32hex, i.e. digits and the letters from a to v
+EVENT_ID_FORMAT = 'openproject{}task{}'
+# Default filter of OpenProject, it is dropped if other filters are given
+OPEN_FILTER = {'status': {'operator': 'o', 'values': []}}
+# Pages of work packages are sorted by id, thus edits do not reorder them
+ID_SORT = json.dumps([['id', 'asc']])
+# Work packages are read by their ids in requests of at most this many ids
+ID_FILTER_SIZE = 100
+# Seconds by which the start of a read is moved back to be the watermark, in
+# case the clock of OpenProject is behind
+WATERMARK_SKEW = 300
+EVENT_FIELDS = 'id,status,htmlLink,summary,description,start,end,extendedProperties'
+EVENT_LIST_FIELDS = 'nextPageToken,nextSyncToken,items({})'.format(EVENT_FIELDS)
+# Projects are rarely added or renamed, their ids are read once an hour
+PROJECTS_TTL = 3600
+
+def get_projects_and_ids(session, url, cache=None, ttl=PROJECTS_TTL):
+    """Reads projects from OpenProject and returns project names and ids.
+
+    Args:
+        session: Authorized OpenProject session
+        url: OpenProject API url, 'your_open_project_url' + '/api/v3/'
+        cache: optional, http_cache.ResponseCache where the projects are
+            memoized, then they are read at most once in `ttl` seconds
+        ttl: seconds during which memoized projects are used, they are read
+            again if it is 0
+
+    Returns:
+        parsed_projects: a dictionary of project ids whose keys are names
+    """
+    def read_projects():
+        read_url = json.loads(session.get(url+"projects/").content.decode('utf-8'))
+        raw_projects = read_url['_embedded']['elements']
+        return {elem['name']:elem['id'] for elem in raw_projects}
 
-    read_url = json.loads(session.get(url+"projects/").content.decode('utf-8'))
-    raw_projects = read_url['_embedded']['elements']
-    parsed_projects = {elem['name']:elem['id'] for elem in raw_projects}
+    if cache is None:
+        return read_projects()
 
-    return parsed_projects
+    return cache.memoized('projects:' + url, ttl, read_projects)
 
 
 def load_credentials(secret_file_path, scopes):
@@ -71,6 +151,8 @@ def load_credentials(secret_file_path, scopes):
     Raises:
         Exception: Possibly a "FileNotFoundError", but might be connection err.
     """
+    from google.oauth2 import service_account
+
     try:
         credentials = service_account.Credentials.from_service_account_file(
             secret_file_path, scopes=scopes)
@@ -79,43 +161,448 @@ def load_credentials(secret_file_path, scopes):
         raise error
 
 
-def google_calendar_service(credentials):
+def refresh_credentials(credentials, margin=300, cache=None):
+    """Refreshes the access token of credentials if it is about to expire.
+
+    Tokens expire in 60 minutes. Long-running processes refresh the token
+    `margin` seconds before that, instead of failing a call with an expired
+    token in the middle of a synchronization. If a `cache` is given, a valid
+    token saved by a previous run is used instead of refreshing, and the
+    refreshed token is saved for the next runs.
+
+    Args:
+        credentials: google.oauth2.service_account.Credentials object
+        margin: seconds before expiry to refresh the token
+        cache: optional token_cache.TokenCache shared by runs
+    """
+    from google.auth.transport.requests import Request
+
+    if cache is not None:
+        cache.refresh(credentials, margin)
+    elif credentials.token is None or credentials.expiry is None or \
+            credentials.expiry - datetime.utcnow() < timedelta(seconds=margin):
+        credentials.refresh(Request())
+
+
+def google_calendar_service(credentials, cache_dir=DISCOVERY_CACHE_DIR,
+                            observer=None, http=None):
     """Creates service for Google Calendar based on given credentials."""
     try:
-        service = build('calendar', 'v3', credentials=credentials)
+        service = build_service('calendar', 'v3', credentials, cache_dir, observer,
+                                http)
     except Exception as error:
         raise error
 
     return service
 
 
-def google_sheet_service(credentials):
+def google_sheet_service(credentials, cache_dir=DISCOVERY_CACHE_DIR,
+                         observer=None, http=None):
     """Creates service for Google Calendar based on given credentials."""
     try:
-        service = build('sheets', 'v4', credentials=credentials)
+        service = build_service('sheets', 'v4', credentials, cache_dir, observer,
+                                http)
     except Exception as error:
         raise error
 
     return service
 
 
-def openproject_session(api_key):
-    """Create a session with given api key"""
+def build_service(api, version, credentials, cache_dir=DISCOVERY_CACHE_DIR,
+                  observer=None, http=None):
+    """Builds a Google API service from a locally cached discovery document.
+
+    Building a service with `googleapiclient.discovery.build` downloads and
+    parses the discovery document of the API each time. Instead, the document
+    is kept in `cache_dir` and the service is built from it. Requests of the
+    service are sent on a thread-safe pool of connections, see
+    transport.PooledHttp, which can be shared by services, and their
+    responses are parsed by transport.FastJsonModel.
+
+    Args:
+        api: name of the API, e.g. 'calendar'
+        version: version of the API, e.g. 'v3'
+        credentials: google.oauth2.service_account.Credentials object
+        cache_dir: directory of cached discovery documents
+        observer: optional, called with uri, method, body, response and
+            content of each request of the service, see transport.PooledHttp
+        http: optional transport.PooledHttp shared with other services, its
+            own observer is used instead of `observer`
+
+    Returns:
+        service: Google API service
+    """
+    from googleapiclient.discovery import build_from_document
+    from transport import FastJsonModel, PooledHttp
+
+    document = discovery_document(api, version, cache_dir)
+
+    return build_from_document(document,
+                               http=http or PooledHttp(credentials, observer=observer),
+                               model=FastJsonModel())
+
+
+def discovery_document(api, version, cache_dir=DISCOVERY_CACHE_DIR,
+                       max_age=7 * 24 * 60 * 60):
+    """Returns the discovery document of an API from cache or downloads it.
+
+    A cached document older than `max_age` seconds is downloaded again to
+    follow the changes of the API. If the download fails, the old document is
+    used. Cache files are named after DISCOVERY_CACHE_VERSION, so that a
+    change in their format does not use files written by older versions.
+
+    Args:
+        api: name of the API, e.g. 'calendar'
+        version: version of the API, e.g. 'v3'
+        cache_dir: directory of cached discovery documents
+        max_age: seconds after which a cached document is downloaded again
+
+    Returns:
+        document: discovery document in json string
+    """
+    path = os.path.join(cache_dir, '{}.{}.v{}.json'.format(
+        api, version, DISCOVERY_CACHE_VERSION))
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < max_age:
+        with open(path, encoding='utf-8') as cache_file:
+            return cache_file.read()
+
+    try:
+        response = requests.get(DISCOVERY_URL.format(api=api, version=version),
+                                timeout=30)
+        response.raise_for_status()
+        document = response.text
+    except Exception:
+        if not os.path.exists(path):
+            raise
+        with open(path, encoding='utf-8') as cache_file:  # Old but working
+            return cache_file.read()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'w', encoding='utf-8') as cache_file:
+        cache_file.write(document)
+    os.replace(temporary_path, path)  # Other processes never see a half file
+
+    return document
+
+
+def openproject_session(api_key, cache=None):
+    """Create a session with given api key.
+
+    If a `cache`, i.e. http_cache.ResponseCache, is given, responses are
+    kept in it and revalidated with conditional requests, see
+    http_cache.CachingAdapter.
+    """
     session = requests.sessions.Session()  # Session to OpenProject
     session.auth = requests.auth.HTTPBasicAuth('apikey', api_key)  # Authorization
+    if cache is not None:  # Unchanged responses are not downloaded again
+        adapter = CachingAdapter(cache)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
 
     return session
 
 
-def read_workpackages(session, url, project_id):
-    """Reads work packages from OpenProject and return as json"""
+def time_window(past_days, future_days, now=None):
+    """Returns the sliding window of synchronization around today.
+
+    The window starts at the local midnight `past_days` before today and
+    ends at the local midnight after `future_days` after today. Thus, work
+    packages due on any day from the first to the last day are in the window.
+
+    Args:
+        past_days: number of days before today in the window
+        future_days: number of days after today in the window
+        now: optional, current time with time zone, for testing
+
+    Returns:
+        window: (start, end) in datetime with time zone
+    """
+    today = (now or datetime.now().astimezone()).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+
+    return (today - timedelta(days=past_days),
+            today + timedelta(days=future_days + 1))
+
+
+def window_shards(window, shard_days=None):
+    """Splits the window into consecutive windows of `shard_days` days"""
+    start, end = window
+    if not shard_days:
+        return [window]
+    shards = []
+    while start < end:
+        shards.append((start, min(start + timedelta(days=shard_days), end)))
+        start = shards[-1][1]
+
+    return shards
+
+
+def window_filters(window, shard_days=None):
+    """Returns OpenProject filters of the work packages in each shard of window.
+
+    Work packages without a due date are synchronized on their creation date,
+    thus each shard is read with two disjoint sets of filters, i.e. two
+    queries: work packages due in the shard, and work packages without a due
+    date created in the shard.
+
+    Args:
+        window: (start, end) as returned from time_window()
+        shard_days: if given, the window is split into shards of this many days
+
+    Returns:
+        shards: a list of filter lists, see read_workpackages()
+    """
+    shards = []
+    for start, end in window_shards(window, shard_days):
+        days = [start.date().isoformat(), (end - timedelta(days=1)).date().isoformat()]
+        shards.append([{'dueDate': {'operator': '<>d', 'values': days}}])
+        shards.append([{'dueDate': {'operator': '!*', 'values': []}},
+                       {'createdAt': {'operator': '<>d', 'values': days}}])
+
+    return shards
+
+
+def read_workpackages(session, url, project_id, page_size=100, max_workers=4,
+                      params=None, select=WORK_PACKAGE_SELECT, shards=None):
+    """Reads work packages of a project page by page and yields each of them.
+
+    OpenProject paginates collections with the `offset` (1-based page number)
+    and `pageSize` parameters. The first page is read to learn the `total`
+    number of work packages and the page size accepted by the server. The
+    remaining pages are fetched concurrently, at most `max_workers` pages at a
+    time, and their elements are yielded in order. Therefore, only a bounded
+    number of pages is kept in memory regardless of the size of the project.
+    If the server does not report `total`, `_links.nextByOffset` is followed.
+    Only the fields listed in `select` are requested, which shrinks pages to
+    a fraction of the full representation of work packages.
+
+    Pages are sorted by id, so that a work package that is edited during the
+    read does not move the others across the pages. Still, a work package
+    that is closed or added during the read shifts the others. Thus, the
+    number of distinct work packages read is checked against `total` of
+    every page, and an error is raised after the last one if they differ,
+    before their events can be deleted as if their work packages were gone.
+
+    Args:
+        session: Authorized OpenProject session
+        url: OpenProject API url, 'your_open_project_url' + '/api/v3/'
+        project_id: ID of the project whose work packages are read
+        page_size: requested number of work packages per page
+        max_workers: maximum number of pages fetched at the same time
+        params: other query parameters such as `filters`, added to each page
+        select: `select` parameter of OpenProject, i.e. the requested fields,
+            everything is requested if None. Overridden by `params`.
+        shards: optional, a list of filter lists, e.g. from window_filters().
+            Work packages matching any of them are read, see read_shards().
+
+    Yields:
+        elem: a work package element in json structure
+
+    Raises:
+        RuntimeError: if the work packages have changed during the read, so
+            that some of them might not have been read
+    """
+    if shards is not None:
+        yield from read_shards(session, url, project_id, shards, page_size,
+                               max_workers, params, select)
+        return
+
     api_url = url + "projects/{}/work_packages".format(project_id)
-    workpackages = json.loads(session.get(api_url).content.decode('utf-8'))
+    params = dict({'select': select} if select else {}, sortBy=ID_SORT,
+                  **(params or {}))
+    first_page = read_page(session, api_url,
+                           dict(params, offset=1, pageSize=page_size))
+    yield from first_page['_embedded']['elements']
+
+    if 'total' not in first_page:  # Unknown size, follow the links one by one
+        page = first_page
+        while page['_links'].get('nextByOffset'):
+            next_url = urljoin(api_url, page['_links']['nextByOffset']['href'])
+            page = read_page(session, next_url)
+            yield from page['_embedded']['elements']
+        return
+
+    page_size = first_page['pageSize'] or page_size  # Server may cap pageSize
+    total = first_page['total']
+    last_offset = -(-total // page_size)  # Ceiling division
+    read_ids = {elem['id'] for elem in first_page['_embedded']['elements']}
+    totals = {total}
+    offsets = iter(range(2, last_offset + 1))
+
+    def submit_next(executor, window):
+        offset = next(offsets, None)
+        if offset is not None:
+            window.append(executor.submit(read_page, session, api_url,
+                                          dict(params, offset=offset,
+                                               pageSize=page_size)))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque()
+        for _ in range(max_workers):  # Fill the window
+            submit_next(executor, window)
+        while window:
+            page = window.popleft().result()
+            submit_next(executor, window)  # Keep the window full
+            totals.add(page['total'])
+            read_ids.update(elem['id'] for elem in page['_embedded']['elements'])
+            yield from page['_embedded']['elements']
+
+    if totals != {len(read_ids)}:
+        raise RuntimeError('Work packages of project {} have changed during the '
+                           'read, {} of {} are read'.format(project_id, len(read_ids),
+                                                            max(totals)))
+
+
+def read_shards(session, url, project_id, shards, page_size=100, max_workers=4,
+                params=None, select=WORK_PACKAGE_SELECT):
+    """Reads work packages matching any of the filter lists in `shards`.
+
+    OpenProject combines filters with AND, thus each shard is a separate
+    query whose filters are added to the `filters` of `params`, or to the
+    filter of open work packages that OpenProject applies by default. Shards are
+    read concurrently, at most `max_workers` of them at a time, each page by
+    page, and their work packages are yielded shard by shard. Shards should
+    not overlap, otherwise a work package is yielded more than once.
 
-    return workpackages
+    Args:
+        session: Authorized OpenProject session
+        url: OpenProject API url, 'your_open_project_url' + '/api/v3/'
+        project_id: ID of the project whose work packages are read
+        shards: a list of filter lists, e.g. from window_filters()
+        page_size: requested number of work packages per page
+        max_workers: maximum number of shards read at the same time
+        params: other query parameters, added to each query
+        select: requested fields of work packages, see read_workpackages()
+
+    Yields:
+        elem: a work package element in json structure
+    """
+    params = dict(params or {})
+    filters = json.loads(params.pop('filters', json.dumps([OPEN_FILTER])))
+    shards = iter(shards)
+
+    def read_shard(shard):
+        return list(read_workpackages(session, url, project_id, page_size, 1,
+                                      dict(params, filters=json.dumps(filters + shard)),
+                                      select))
+
+    def submit_next(executor, window):
+        shard = next(shards, None)
+        if shard is not None:
+            window.append(executor.submit(read_shard, shard))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        window = deque()
+        for _ in range(max_workers):
+            submit_next(executor, window)
+        while window:
+            elements = window.popleft().result()
+            submit_next(executor, window)
+            yield from elements
+
+
+def read_changed_workpackages(session, url, project_id, store, page_size=100,
+                              max_workers=4, select=WORK_PACKAGE_SELECT,
+                              window=None, shard_days=None):
+    """Reads only the work packages changed since the previous run.
+
+    Work packages of the project are kept in the `store` together with the
+    start time of the last successful read, i.e. the watermark. If there is
+    no watermark, all work packages are read. Otherwise, only the open work
+    packages updated after the watermark are read by use of the `filters`
+    parameter. The greatest `updatedAt` read is not a safe watermark, a work
+    package on a page that is already read may be updated before the read
+    ends with an `updatedAt` below it. Thus, the watermark is the start of
+    the read, moved back by WATERMARK_SKEW to cover the difference between
+    the clocks, and a few work packages are read twice. Closed or deleted work packages are detected by listing only
+    the ids of the open work packages, and are removed from the store. Thus,
+    a run without any change costs a couple of small requests.
+
+    If a `window` is given, only the work packages in it are read and kept.
+    Work packages that enter the window as it slides are not changed, but
+    they are listed as open and read as missing ones. The first read is split
+    into shards of `shard_days`, whereas the incremental reads are small and
+    query the whole window at once.
 
+    Args:
+        session: Authorized OpenProject session
+        url: OpenProject API url, 'your_open_project_url' + '/api/v3/'
+        project_id: ID of the project whose work packages are read
+        store: state_store.StateStore that keeps work packages between runs
+        page_size: requested number of work packages per page
+        max_workers: maximum number of pages fetched at the same time
+        select: requested fields of work packages, see read_workpackages()
+        window: optional, (start, end) as returned from time_window()
+        shard_days: if given, the first read of the window is split into
+            shards of this many days that are read in parallel
 
-def parse_workpackages(workpackages):
+    Returns:
+        workpackages: all open work packages of the project, read from store
+    """
+    watermark_key = 'watermark:{}'.format(project_id)
+    watermark = store.get(watermark_key)
+    open_filter = OPEN_FILTER
+
+    shards = None if window is None else window_filters(window)
+
+    started_at = (datetime.now(timezone.utc) - timedelta(seconds=WATERMARK_SKEW))
+    if watermark is None:  # First run, read everything
+        store.save_work_packages(project_id, [], replace=True)
+        elements = read_workpackages(
+            session, url, project_id, page_size, max_workers, select=select,
+            shards=None if window is None else window_filters(window, shard_days))
+    else:
+        changed_filter = {'updatedAt': {'operator': '<>d', 'values': [watermark, '']}}
+        elements = read_workpackages(session, url, project_id, page_size,
+                                     max_workers,
+                                     {'filters': json.dumps([open_filter, changed_filter])},
+                                     select, shards)
+    save_in_chunks(store, project_id, elements)
+
+    # Open work packages on OpenProject, only their ids are requested
+    id_pages = read_workpackages(session, url, project_id, 1000, max_workers,
+                                 {'filters': json.dumps([open_filter]),
+                                  'select': 'total,count,pageSize,elements/id'},
+                                 shards=shards)
+    open_ids = {elem['id'] for elem in id_pages}
+    saved_ids = store.work_package_ids(project_id)
+    store.delete_work_packages(project_id, saved_ids - open_ids)
+    missing_ids = open_ids - saved_ids  # Not changed but not saved either
+    missing_ids = sorted(missing_ids)
+    for start in range(0, len(missing_ids), ID_FILTER_SIZE):  # Bounded urls
+        id_filter = {'id': {'operator': '=', 'values': [
+            str(wp_id) for wp_id in missing_ids[start:start + ID_FILTER_SIZE]]}}
+        elements = read_workpackages(session, url, project_id, page_size,
+                                     max_workers,
+                                     {'filters': json.dumps([id_filter])},
+                                     select)
+        save_in_chunks(store, project_id, elements)
+    store.set(watermark_key, started_at.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+    return store.iter_work_packages(project_id)
+
+
+def save_in_chunks(store, project_id, elements, chunk_size=500):
+    """Saves work packages to the store, `chunk_size` of them at a time"""
+    chunk = []
+    for elem in elements:
+        chunk.append(elem)
+        if len(chunk) == chunk_size:
+            store.save_work_packages(project_id, chunk)
+            chunk = []
+    store.save_work_packages(project_id, chunk)
+
+
+def read_page(session, api_url, params=None):
+    """Reads a single page of an OpenProject collection and returns as json"""
+    response = session.get(api_url, params=params)
+    response.raise_for_status()
+
+    return json_loads(response.content)
+
+
+def parse_workpackages(workpackages, project_id=None):
     """Parses read workpackages into a structured dictionary element.
 
     Shapes work packages into a standard structure to use in the event creation
@@ -130,99 +617,417 @@ def parse_workpackages(workpackages):
     exclamations (!) marks, it will not be synchronized.
 
     Args:
-        workpackages: all workpackages returned from read_workpackages() func.
+        workpackages: work packages yielded by read_workpackages() func. A
+            single page in json structure is also accepted.
+        project_id: ID of the project of the work packages, if it is given,
+            their events are created with ids derived from it, see event_id()
 
     Returns:
-        parsed_wps: a dictionary of structured workpackages. Key is wp ID.
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
         err: a list of could not structured workpackages with Exception info
     """
     parsed_wps = {}
     err = []
-    for elem in workpackages['_embedded']['elements']:
+    if isinstance(workpackages, dict):  # A single page of work packages
+        workpackages = workpackages['_embedded']['elements']
+    for elem in workpackages:
         # If description returns None, it will not be synfchronized
+        raw = elem['description']['raw']
+        if raw is None:
+            continue
         # Packages starting with "!!!" line will not be synchronized
-        if elem['description']['raw'] is None or \
-            elem['description']['raw'].split('\n')[0] == '!!!':
-            pass # Do not synchronize this package to Calendar
-        else:
-            try:
-                tmp = {}
-                tmp['wp_id'] = elem['id']  # Read work package ID
-                tmp['subject'] = elem['subject'].strip()  # Read work package subject
-                tmp['description'] = elem['description']['html']  # Save description
-
-                if elem['_links']['parent']['href']:  # If there is a parent
-                    tmp['parent'] = elem['_links']['parent']['href'].split('/')[-1] \
-                        + ":" + elem['_links']['parent']['title']
-                else:
-                    tmp['parent'] = "No parent"
-
-                if elem['_links']['assignee']['href']:  # There might not be an assignee
-                    tmp['assignee'] = elem['_links']['assignee']['title'] # if there is
-                else:
-                    tmp['assignee'] = 'Not assigned to anyone'  # if there is not
-
-                if elem['dueDate']:  # Assumes due hour is specified
-                    tmp['due_date'] = elem['dueDate']  # if specified
-                    tmp['due_hour'] = elem['description']['raw'].split('\n')[-1].split('=')[-1].strip()
-                else:  # dueHour has no effect on time even if it is specified
-                    tmp['due_date'] = elem['createdAt'].split('T')[0]  # create date
-                    tmp['due_hour'] = elem['createdAt'].split('T')[-1][:-1]  # create time
-
-                tmp['updated_at'] = elem['updatedAt']
-                parsed_wps[elem['id']] = tmp
-            except Exception as error:
-                err.append([elem, error])
+        lines = raw.split('\n')
+        if lines[0] == '!!!':
+            continue  # Do not synchronize this package to Calendar
+        try:
+            links = elem['_links']
+            parent = links['parent']
+            if parent['href']:  # If there is a parent
+                parent = parent['href'].rpartition('/')[2] + ":" + parent['title']
+            else:
+                parent = "No parent"
+            assignee = links['assignee']
+            # There might not be an assignee
+            assignee = assignee['title'] if assignee['href'] else 'Not assigned to anyone'
+            if elem['dueDate']:  # Assumes due hour is specified
+                due_date = elem['dueDate']
+                due_hour = lines[-1].rpartition('=')[2].strip()
+            else:  # dueHour has no effect on time even if it is specified
+                due_date, _, due_hour = elem['createdAt'].partition('T')  # create date
+                due_hour = due_hour[:-1]  # create time
+            parsed_wps[elem['id']] = WorkPackageRecord(
+                elem['id'], elem['subject'].strip(), elem['description']['html'],
+                parent, assignee, due_date, due_hour, elem['updatedAt'], project_id)
+        except Exception as error:
+            err.append([elem, error])
 
     return parsed_wps, err
 
 
-def read_events(service, calendar_id, time='2020-10-11T00:00:00Z'):
+def route_workpackages(parsed_wps, assignee_calendars, default_calendar=None):
+    """Groups parsed work packages by the calendars of their assignees.
+
+    Work packages are read and parsed once, and each group is synchronized
+    with its own calendar. Every calendar of the routing has a group, even an
+    empty one, so that events of work packages that are assigned to someone
+    else are deleted from it.
+
+    Args:
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
+        assignee_calendars: a dictionary of calendar IDs, keys are assignees
+            as they are parsed, e.g. 'Jane Doe' or 'Not assigned to anyone'
+        default_calendar: optional, calendar of the work packages whose
+            assignees are not routed, otherwise they are not synchronized
+
+    Returns:
+        groups: a dictionary of parsed_wps of each calendar. Key is calendar ID.
+    """
+    groups = {calendar_id: {} for calendar_id in assignee_calendars.values()}
+    if default_calendar is not None:
+        groups.setdefault(default_calendar, {})
+    for wp_id, work_package in parsed_wps.items():
+        calendar_id = assignee_calendars.get(work_package.assignee, default_calendar)
+        if calendar_id is not None:
+            groups[calendar_id][wp_id] = work_package
+
+    return groups
+
+
+def read_events(service, calendar_id, time='2020-10-11T00:00:00Z', store=None,
+                window=None, shard_days=None, max_workers=4, project_id=None):
     """Reads and returns all events on the calendar after the specified time
+
+    All pages of the listing are read. If a `store` is given, the events and
+    the `nextSyncToken` of the listing are saved to it. Then, the next call
+    only downloads the events changed since the previous call and merges them
+    with the saved ones. If Google reports that the sync token is no longer
+    valid (410 Gone), a full read is performed again.
+
+    If a `window` is given, only the events in it are read, see
+    list_window_events(). Google does not accept `timeMin` and `timeMax`
+    together with a sync token, and the changes reported for a sync token
+    would not follow the window as it slides. Thus, windowed reads do not use
+    sync tokens; the saved token is dropped so that a later read without a
+    window does not continue from it.
+
+    If a `store` and a `project_id` are given, full and windowed reads list
+    only the events tagged with the project, see managed_events_filter(),
+    thus events added to the calendar by hand are not downloaded. Incremental
+    reads cannot be filtered, Google does not accept `privateExtendedProperty`
+    together with a sync token.
+
+    Args:
+        service: Google API service built with Calendar scope
+        calendar_id: Calendar ID of Google Calendar
+        time: events ending before this time are not read in a full read
+        store: optional state_store.StateStore to read incrementally
+        window: optional, (start, end) as returned from time_window()
+        shard_days: if given, the window is split into shards of this many
+            days that are listed in parallel
+        max_workers: maximum number of shards listed at the same time
+        project_id: optional, ID of the project whose events are read
+
+    Returns:
+        events: a list of events in json structure
+
     Bug: What happens if this function returns nothing and raises an exception?
     """
+    from googleapiclient.errors import HttpError
+
     try:
-        events_result = service.events().list(calendarId=calendar_id, timeMin=time).execute()
-        events = events_result.get('items', [])
+        managed = managed_events_filter(store, calendar_id, project_id)
+        if window is not None:
+            events = list_window_events(service, calendar_id, window, shard_days,
+                                        max_workers, **managed)
+            if store is not None:
+                store.delete('sync_token:' + calendar_id)
+                tag_migrated(store, calendar_id, events)
+            return events
+        if store is None:
+            events, _ = list_events(service, calendar_id, timeMin=time)
+            return events
+
+        token_key = 'sync_token:' + calendar_id
+        sync_token = store.get(token_key)
+        changed = None
+        if sync_token is not None:
+            try:
+                changed, sync_token = list_events(service, calendar_id,
+                                                  syncToken=sync_token)
+            except HttpError as error:
+                if error.resp.status != 410:  # 410: Token expired, full read
+                    raise
+
+        if changed is None:
+            events, sync_token = list_events(service, calendar_id, timeMin=time,
+                                             **managed)
+            store.save_events(calendar_id, events, replace=True)
+        else:
+            store.save_events(calendar_id, changed)
+        store.set(token_key, sync_token)
+        events = store.load_events(calendar_id)
+        tag_migrated(store, calendar_id, events)
+
         return events
     except Exception as error:
         print(error)
 
-def parse_events(events):
+
+def list_events(service, calendar_id, **kwargs):
+    """Lists events on the calendar by following `nextPageToken`s.
+
+    Unless they are given in `kwargs`, only the fields of events that are
+    parsed are requested (`fields`), and pages are as large as Google allows
+    (`maxResults`), so that a listing takes fewer and smaller responses.
+
+    Args:
+        service: Google API service built with Calendar scope
+        calendar_id: Calendar ID of Google Calendar
+        kwargs: other parameters of the events().list() call
+
+    Returns:
+        events: events on all of the pages
+        sync_token: `nextSyncToken` returned with the last page
+    """
+    kwargs.setdefault('fields', EVENT_LIST_FIELDS)
+    kwargs.setdefault('maxResults', 2500)
+    events = []
+    page_token = None
+    while True:
+        result = service.events().list(calendarId=calendar_id,
+                                       pageToken=page_token, **kwargs).execute()
+        events.extend(result.get('items', []))
+        page_token = result.get('nextPageToken')
+        if page_token is None:
+            return events, result.get('nextSyncToken')
+
+
+def managed_events_filter(store, calendar_id, project_id):
+    """Returns the listing parameter that selects the events of a project.
+
+    Events are tagged with their project and work package in their private
+    extended properties, see wp_to_event(). Events synchronized by older
+    versions are not tagged until they are updated, and filtering would hide
+    them. Thus, the filter is used only after tag_migrated() has found that
+    every synchronized event on the calendar is tagged.
+
+    Returns:
+        kwargs: {'privateExtendedProperty': 'projectId=<id>'} or {}
+    """
+    if store is None or project_id is None or not store.get('tagged:' + calendar_id):
+        return {}
+
+    return {'privateExtendedProperty': 'projectId={}'.format(project_id)}
+
+
+def tag_migrated(store, calendar_id, events):
+    """Records that the events of the calendar are tagged if none is untagged"""
+    if not store.get('tagged:' + calendar_id) and \
+            not any(is_untagged(event) for event in events):
+        store.set('tagged:' + calendar_id, True)
+
+
+def is_untagged(event):
+    """Checks whether an event is synchronized but not tagged, see wp_to_event()"""
+    private = (event.get('extendedProperties') or {}).get('private') or {}
+
+    return 'wpId' not in private and event.get('status') != 'cancelled' and \
+        event.get('summary', '').partition(':')[0].isdigit()
+
+
+def list_window_events(service, calendar_id, window, shard_days=None, max_workers=4,
+                       **kwargs):
+    """Lists events within the window, its shards are listed in parallel.
+
+    Google lists the events that end after `timeMin` and start before
+    `timeMax`. Thus, an event crossing the boundary of two shards is listed
+    by both of them, events are merged by their ids.
+
+    Args:
+        service: Google API service built with Calendar scope
+        calendar_id: Calendar ID of Google Calendar
+        window: (start, end) as returned from time_window()
+        shard_days: if given, the window is split into shards of this many days
+        max_workers: maximum number of shards listed at the same time
+        kwargs: other parameters of the events().list() calls
+
+    Returns:
+        events: events in the window, each of them once
+    """
+    def list_shard(shard):
+        return list_events(service, calendar_id, timeMin=shard[0].isoformat(),
+                           timeMax=shard[1].isoformat(), **kwargs)[0]
+
+    events = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for shard_events in executor.map(list_shard, window_shards(window, shard_days)):
+            for event in shard_events:
+                events[event['id']] = event
+
+    return list(events.values())
+
+def parse_events(events, project_id=None):
     """Parses events based on the structure used to create events.
 
     In order to check its content and situation, each event must be parsed
-    into a predefined structure.
+    into a predefined structure. The work package of an event and its
+    `updated_at` are read from the private extended properties of the event,
+    see wp_to_event(), thus renaming the event does not break the match, and
+    events tagged with another project are skipped. Events synchronized by
+    older versions are not tagged. Their work package is found from their id
+    if it is derived from the work package, see event_id(), otherwise from
+    the summary, and their assignee and `updated_at` are the last lines of
+    their description. Content hashes are computed from the content itself,
+    so that events edited on the calendar are updated again. `updated_at` of
+    such events, and of events that are not tagged, is None, thus they are
+    compared with their work packages in synchronize_wps().
 
     Args:
         events: all events returned from read_events() func.
+        project_id: optional, ID of the project whose events are parsed
 
     Returns:
-        parsed_events: a dictionary of structured events. Key is wp ID.
+        parsed_events: a dictionary of records.EventRecord. Key is wp ID.
         err: a list of could not structured events with Exception info
     """
     parsed_events = {}
     err = []
+    project_id = None if project_id is None else str(project_id)
     for elem in events:
         try:
-            tmp = {}
-            tmp['event_id'] = elem['id']  # ID required in deletion and update
-            summary = elem['summary'].split(':')  # Split title of event
-            tmp['wp_id'] = summary[0]  # Workpackage ID on Openproject
-            tmp['subject'] = summary[-1]  # Workpackage subject on OpenProject
-            description = elem['description'].split('\n')  # Split description
-            tmp['assignee'] = description[-2]  # Assigne on OpenProject
-            tmp['updated_at'] = description[-1]  # Update time of wp saved on Calendar
-            due = elem['end']['dateTime'].split('T')  # Split dueDate to date, time
-            tmp['due_date'] = due[0]  # DueDate of created event
-            tmp['due_hour'] = due[1]  # DueHour of created event
-            parsed_events[int(tmp['wp_id'])] = tmp  # Save to parsed_events dic.
+            summary = elem['summary']  # wp ID and subject, e.g. "12:Subject"
+            private = (elem.get('extendedProperties') or {}).get('private') or {}
+            if 'wpId' in private:  # Tagged event
+                if project_id is not None and \
+                        private.get('projectId', project_id) != project_id:
+                    continue
+                wp_id, updated_at = int(private['wpId']), private.get('updatedAt')
+                assignee = None
+            else:
+                wp_id = wp_id_of_event(elem['id'])
+                if wp_id is None:  # Workpackage ID on Openproject from summary
+                    wp_id = int(summary.partition(':')[0])
+                # Assignee and update time of wp are the last lines of description
+                assignee, updated_at = elem['description'].rsplit('\n', 2)[-2:]
+            due_date, _, due_hour = elem['end']['dateTime'].partition('T')
+            hashes = event_hashes(elem)  # Hash of synced content and its fields
+            if private.get('contentHash') != hashes[0]:  # Not as synchronized
+                updated_at = None
+            parsed_events[wp_id] = EventRecord(
+                wp_id, elem['id'], summary.rpartition(':')[2], updated_at,
+                hashes[0], hashes[1], assignee, due_date, due_hour)
         except Exception as error:
             err.append([elem, error])  # If a parsin error occurs, save to err list
 
     return parsed_events, err
 
 
+def read_indexed_events(service, calendar_id, store, reconcile_interval=86400,
+                        time='2020-10-11T00:00:00Z', window=None, shard_days=None,
+                        project_id=None):
+    """Returns synchronized events from the local index instead of the calendar.
+
+    The index maps each wp_id to the id of its event, the last synchronized
+    `updated_at` and the content hash of the event. It is kept up to date by
+    synchronize_wps(), thus the calendar does not have to be listed on each
+    run. However, events might be changed on the calendar by others. Thus,
+    once in every `reconcile_interval` seconds, or if there is no index yet,
+    events are read and the index is rebuilt from them to repair the drift.
+
+    Args:
+        service: Google API service built with Calendar scope
+        calendar_id: Calendar ID of Google Calendar
+        store: state_store.StateStore where the index is kept
+        reconcile_interval: seconds between two reconciliations
+        time: events ending before this time are not read in reconciliation
+        window: optional, only the events in this window are read in
+            reconciliation, see read_events()
+        shard_days: if given, the window is read in shards of this many days
+        project_id: optional, only the events of this project are read in
+            reconciliation
+
+    Returns:
+        parsed_events: a dictionary of records.EventRecord. Key is wp ID.
+        err: a list of could not structured events with Exception info
+    """
+    reconciled_key = 'reconciled_at:' + calendar_id
+    reconciled_at = store.get(reconciled_key)
+    if reconciled_at is None or \
+            datetime.now().timestamp() - reconciled_at >= reconcile_interval:
+        parsed_events, err = parse_events(
+            read_events(service, calendar_id, time, store, window, shard_days,
+                        project_id=project_id), project_id)
+        store.save_index(calendar_id, [event.as_dict() for event
+                                       in parsed_events.values()], replace=True)
+        store.set(reconciled_key, datetime.now().timestamp())
+    else:
+        err = []
+
+    return load_indexed_events(store, calendar_id), err
+
+
+def load_indexed_events(store, calendar_id):
+    """Returns the index of events as a dictionary of records.EventRecord"""
+    return {wp_id: EventRecord(**entry) for wp_id, entry
+            in store.load_index(calendar_id).items()}
+
+
+def addressed_events(wp_ids, removed_wp_ids, project_id, parsed_events=None):
+    """Returns the events of given work packages without reading the calendar.
+
+    synchronize_wps() synchronizes only the given work packages when it is
+    called with their parsed work packages and these events: events of the
+    work packages in `wp_ids` are updated if they are known, or inserted,
+    which updates them if they exist, see idempotent_response(). Events of
+    the work packages in `removed_wp_ids` are deleted by their known ids or
+    by the ids derived from the work packages, see event_id().
+
+    Args:
+        wp_ids: IDs of the work packages that are synchronized
+        removed_wp_ids: IDs of the closed or deleted work packages
+        project_id: ID of the project of the work packages
+        parsed_events: optional, known events, e.g. from the index of events
+
+    Returns:
+        parsed_events: a dictionary of records.EventRecord. Key is wp ID.
+    """
+    parsed_events = parsed_events or {}
+    events = {wp_id: parsed_events[wp_id] for wp_id in wp_ids if wp_id in parsed_events}
+    for wp_id in removed_wp_ids:
+        events[wp_id] = parsed_events.get(wp_id) or EventRecord(
+            wp_id, event_id(project_id, wp_id), str(wp_id), None, None)
+
+    return events
+
+
+def update_index(store, calendar_id, parsed_wps, results):
+    """Saves results of successful calendar calls to the index of events.
+
+    Args:
+        store: state_store.StateStore where the index is kept
+        calendar_id: Calendar ID of Google Calendar
+        parsed_wps: a dictionary of records.WorkPackageRecord, or of
+            records.JournalEntry, whose `subject` and `updated_at` are saved.
+            Key is wp ID.
+        results: (action, wp_id, response) for each successful call
+    """
+    entries, deleted = [], []
+    for action, wp_id, response in results:
+        if action == 'delete':
+            deleted.append(wp_id)
+        else:  # Created or updated, response is the event itself
+            hashes = event_hashes(response)
+            entries.append({'wp_id': wp_id,
+                            'event_id': response['id'],
+                            'subject': parsed_wps[wp_id].subject,
+                            'updated_at': parsed_wps[wp_id].updated_at,
+                            'content_hash': hashes[0],
+                            'field_hashes': hashes[1],
+                            'due_date': response['end']['dateTime'].partition('T')[0]})
+    store.save_index(calendar_id, entries)
+    store.delete_index(calendar_id, deleted)
+
+
 def wp_to_event(work_package):
     """Converts workpackage to required event structure of Google Calendar
 
@@ -233,23 +1038,29 @@ def wp_to_event(work_package):
     "dueHour" parameter should be located at the end of the description in the
     form of "dueHour=HH:MM:SS" where H is hour, M is minute, and S is second.
     Note: Seperation oh H, M, and S must be done via `colon` (:) mark.
+    If the project of the work package is known, the id of the event is
+    derived from it, see event_id().
+    The description is kept for people reading the calendar. The work package,
+    its project, `updated_at` and the content hash of the event are saved to
+    the private extended properties of the event, which are read back by
+    parse_events() and can be used to list only these events.
 
     Args:
-        work_pakcage: Parsed work package
+        work_pakcage: Parsed work package, a records.WorkPackageRecord
 
     Returns:
         event: An event body to use in API calls"""
     wp = work_package
-    event_start = str_to_date(wp['due_date'], wp['due_hour']) # Start datetime
+    event_start = str_to_date(wp.due_date, wp.due_hour) # Start datetime
     event_finish = event_start + timedelta(hours=1) # Finish datetime
     # Description includes, description, parental relation, assignee and last update datetime
     # Description is saved in HTML formant. It includes </p> at the end.
     # Thus there is no line breaking after description. However, if one uses
     # raw format, line braking should be added between description and parent
-    description = wp['description'] + "Parent=" + wp['parent'] + "\n"\
-                  + wp['assignee'] + "\n" + wp['updated_at']
+    description = wp.description + "Parent=" + wp.parent + "\n"\
+                  + wp.assignee + "\n" + wp.updated_at
 
-    event = {'summary': str(wp['wp_id']) + ':' + wp['subject'],
+    event = {'summary': str(wp.wp_id) + ':' + wp.subject,
              'description': description,
              'start': {'dateTime': event_start.astimezone().isoformat()},
              'end': {'dateTime': event_finish.astimezone().isoformat()},
@@ -261,10 +1072,80 @@ def wp_to_event(work_package):
                      ],
                  },
              }
+    private = {'wpId': str(wp.wp_id), 'updatedAt': wp.updated_at}
+    if wp.project_id is not None:
+        event['id'] = event_id(wp.project_id, wp.wp_id)
+        private['projectId'] = str(wp.project_id)
+    event['extendedProperties'] = {'private': private}
+    private['contentHash'] = content_hash(event)
 
     return event
 
 
+def event_id(project_id, wp_id):
+    """Returns the id of the event of a work package, the same in every run.
+
+    Since the id is known without reading the calendar, the event can be
+    updated or deleted directly, and inserting it twice fails with 409
+    Conflict instead of creating a duplicate.
+    """
+    return EVENT_ID_FORMAT.format(project_id, wp_id)
+
+
+def wp_id_of_event(event_id):
+    """Returns the wp ID of an event id returned from event_id(), else None"""
+    prefix, _, wp_id = event_id.partition('task')
+    if not prefix.startswith('openproject') or not wp_id.isdigit() \
+            or not prefix[len('openproject'):].isdigit():
+        return None
+
+    return int(wp_id)
+
+
+def synced_fields(event):
+    """Returns the normalized fields of an event that follow its work package.
+
+    Start and end times are converted to UTC, so that the same time written
+    with different offsets is equal. The last line of the description, i.e.
+    `updated_at` of the work package, changes with each edit on OpenProject
+    even if nothing synchronized has changed. Thus, it is left out, as well
+    as `updatedAt` and `contentHash` of the extended properties. The work
+    package and the project are included, so that events without them are
+    updated to have them.
+    """
+    description = event.get('description', '').rsplit('\n', 1)[0]
+    private = (event.get('extendedProperties') or {}).get('private') or {}
+    fields = {'summary': event.get('summary', ''), 'description': description,
+              'extendedProperties': {key: private[key] for key in ('wpId', 'projectId')
+                                     if key in private}}
+    for key in ('start', 'end'):
+        date_time = datetime.fromisoformat(
+            event[key]['dateTime'].replace('Z', '+00:00'))
+        fields[key] = date_time.astimezone(timezone.utc).isoformat()
+
+    return fields
+
+
+def content_hash(event, fields=None):
+    """Returns a hash of the synchronized fields of an event body"""
+    fields = json.dumps(fields or synced_fields(event), sort_keys=True)
+
+    return hashlib.sha1(fields.encode('utf-8')).hexdigest()
+
+
+def field_hashes(event, fields=None):
+    """Returns a short hash of each synchronized field of an event body"""
+    return {field: hashlib.sha1(json.dumps(value).encode('utf-8')).hexdigest()[:16]
+            for field, value in (fields or synced_fields(event)).items()}
+
+
+def event_hashes(event):
+    """Returns content_hash() and field_hashes() of an event, normalizes it once"""
+    fields = synced_fields(event)
+
+    return content_hash(event, fields), field_hashes(event, fields)
+
+
 def str_to_date(date, hour):
     """Converts str type date and hour to datetime object
 
@@ -307,15 +1188,7 @@ def to_create(work_package, service, calendar_id):
 
     ToDo: Return a value for success insted of printing
     """
-    wp = work_package
-    event = wp_to_event(wp)
-    try:
-        response = service.events().insert(calendarId=calendar_id,
-                                           body=event).execute()
-        print('Event %s created at: %s' %(event['summary'],
-                                          response.get('htmlLink')))
-    except Exception as error:
-        return str(error)
+    return execute_operation(create_operation(work_package, service, calendar_id))
 
 
 def to_delete(parsed_event, service, calendar_id):
@@ -337,14 +1210,7 @@ def to_delete(parsed_event, service, calendar_id):
 
     ToDo: Return a value for success insted of printing
     """
-    event_id = parsed_event['event_id']
-    subject = parsed_event['subject']
-    try:
-        service.events().delete(calendarId=calendar_id,
-                                eventId=event_id).execute()
-        print('Work Package: {} has been deleted'.format(subject))
-    except Exception as error:
-        return str(error)
+    return execute_operation(delete_operation(parsed_event, service, calendar_id))
 
 
 def may_update(work_package, parsed_event, service, calendar_id):
@@ -354,7 +1220,9 @@ def may_update(work_package, parsed_event, service, calendar_id):
     Google Calendar API ['https://www.googleapis.com/auth/calendar'] scope.
     This function updates an event on the calendar specified  with `event_id`;
     based on a given event (parsed_event), by using previously built service
-    which includes Google Calendar API scope if there is any update.
+    which includes Google Calendar API scope if there is any update. An update
+    is detected by comparing hashes of the synchronized fields, and only the
+    changed fields are patched.
 
     Args:
         work_package: One of the elements of parsed workpackages
@@ -367,33 +1235,441 @@ def may_update(work_package, parsed_event, service, calendar_id):
 
     ToDo: Return a value for success insted of printing
     """
-    wp = work_package
-    if wp['updated_at'] != parsed_event['updated_at']:
-        tmp = wp_to_event(wp)
-        event_id = parsed_event['event_id']
+    return execute_operation(update_operation(work_package, parsed_event,
+                                              service, calendar_id))
+
+
+def create_operation(work_package, service, calendar_id):
+    """Returns the insert request of work package and its success report.
+
+    An operation is a pair of an unexecuted API request and a function that
+    reports the response of the request. Operations can be executed one by
+    one or in batches, see execute_operation() and execute_in_batches().
+    The id of the event is assigned here instead of by Google, so that
+    executing the request again does not create a second event. If an event
+    with the id exists, e.g. an event deleted when its work package was
+    closed, it is updated instead, see idempotent_response().
+    """
+    event = wp_to_event(work_package)
+    if 'id' not in event:  # Project is unknown, base32hex as Google requires
+        event['id'] = uuid.uuid4().hex
+    request = service.events().insert(calendarId=calendar_id, body=event,
+                                      fields=EVENT_FIELDS)
+    request.on_conflict = conflict_update(service, calendar_id, event)
+
+    def report(response):
+        print('Event %s created at: %s' %(event['summary'],
+                                          response.get('htmlLink')))
+
+    return request, report
+
+
+def conflict_update(service, calendar_id, event):
+    """Returns a function that builds the update of an event with the same id.
+
+    The request is built only if the insert conflicts, since building
+    requests takes a considerable time for large numbers of events. Deleted
+    events keep their ids in the `cancelled` status, they are restored.
+    """
+    def build_update():
+        return service.events().update(calendarId=calendar_id, eventId=event['id'],
+                                       body=dict(event, status='confirmed'),
+                                       fields=EVENT_FIELDS)
+
+    return build_update
+
+
+def delete_operation(parsed_event, service, calendar_id):
+    """Returns the delete request of parsed event and its success report"""
+    subject = parsed_event.subject
+    request = service.events().delete(calendarId=calendar_id,
+                                      eventId=parsed_event.event_id)
+
+    def report(response):
+        print('Work Package: {} has been deleted'.format(subject))
+
+    return request, report
+
+
+def update_operation(work_package, parsed_event, service, calendar_id):
+    """Returns the patch request of the event and its success report.
+
+    Returns None if none of the synchronized fields of the event differ from
+    the work package, even if the work package has been updated, e.g. its
+    priority is changed or a comment is added. Otherwise, only the changed
+    fields are sent. If it is unknown which fields have changed, all of the
+    synchronized fields are sent. Extended properties are always sent, so
+    that `updatedAt` and the content hash on the event stay up to date.
+    """
+    event = wp_to_event(work_package)
+    fields = synced_fields(event)
+    if content_hash(event, fields) == parsed_event.content_hash:
+        return None
+
+    old_hashes = parsed_event.field_hashes or {}
+    body = {field: event[field] for field, new_hash
+            in field_hashes(event, fields).items()
+            if old_hashes.get(field) != new_hash}
+    body['extendedProperties'] = event['extendedProperties']
+    request = service.events().patch(calendarId=calendar_id,
+                                     eventId=parsed_event.event_id,
+                                     body=body, fields=EVENT_FIELDS)
+
+    def report(response):
+        print('Event %s has been updated' % response['summary'])
+
+    return request, report
+
+
+def execute_operation(operation, limiter=None, max_retries=0, http=None,
+                      metrics=None):
+    """Executes an operation and returns str(error) if it fails, else None
+
+    Args:
+        operation: an operation as returned from create_operation() etc.
+        limiter: optional RateLimiter that paces the calls
+        max_retries: number of retries if the call fails temporarily
+        http: optional transport to execute the request on
+        metrics: optional instrumentation.RunMetrics that counts retries
+    """
+    if operation is None:  # Nothing to do
+        return None
+
+    request, report = operation
+    try:
+        try:
+            response = execute_with_retries(request, limiter, max_retries, http,
+                                            metrics)
+        except Exception as error:
+            response = idempotent_response(request, error, http)
+            if response is None:
+                raise
+        report(response)
+    except Exception as error:
+        return str(error)
+
+
+def execute_with_retries(request, limiter=None, max_retries=0, http=None,
+                         metrics=None):
+    """Executes a request, retries with exponential backoff if it is limited.
+
+    Rate limit errors (403 `rateLimitExceeded`, 429), server errors (5xx),
+    dropped connections and timeouts are temporary, see is_transient(). The
+    request is retried after a random delay in [0, 2^attempt) seconds, at
+    most 32 seconds, so that concurrent callers do not retry at the same
+    time. Rate limit errors also slow the `limiter` down. Other errors are
+    raised at once. A retried request is counted once in `metrics`.
+
+    Args:
+        request: an unexecuted Google API request
+        limiter: optional RateLimiter that paces the calls
+        max_retries: number of retries before the error is raised
+        http: optional transport to execute the request on
+        metrics: optional instrumentation.RunMetrics that counts retries
+
+    Returns:
+        response: response of the request
+    """
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
         try:
-            updated_event = service.events().update(calendarId=calendar_id,
-                                                    eventId=event_id,
-                                                    body=tmp).execute()
-            print('Event %s has been updated' % updated_event['summary'])
+            return request.execute(http=http)
         except Exception as error:
-            return str(error)
+            if attempt == max_retries or not is_transient(error):
+                raise
+            if limiter is not None and is_rate_limited(error):
+                limiter.slow_down()
+            if metrics is not None and attempt == 0:
+                metrics.record_retry('calendar')
+            time.sleep(random.uniform(0, min(32, 2 ** attempt)))
+
+
+def idempotent_response(request, error, http=None):
+    """Returns the response of a request that failed since it was done before.
+
+    A request might succeed while its response is lost, e.g. the connection
+    drops or the process is killed, and then it is executed again by a retry
+    or by replay_journal(). Inserted events carry their ids, thus inserting
+    one again fails with 409 Conflict. Then, the event is updated by the
+    `on_conflict` request of the insert, if it has one, since the existing
+    event might also be an older one, e.g. a deleted event of a reopened work
+    package. Deleting an event again fails with 404 Not Found or 410 Gone.
+    These are the outcomes that were wanted.
+
+    Args:
+        request: the failed Google API request
+        error: the exception raised by the request
+        http: optional transport to execute the update on
+
+    Returns:
+        response: the updated event, the inserted event as it was sent, or an
+            empty string for a deletion, None if the error is not one of the above
+    """
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        return None
+    if request.method == 'POST' and error.resp.status == 409:
+        on_conflict = getattr(request, 'on_conflict', None)
+        if on_conflict is not None:
+            return on_conflict().execute(http=http)
+        return json_loads(request.body)
+    if request.method == 'DELETE' and error.resp.status in (404, 410):
+        return ''
+
+    return None
+
+
+def is_transient(error):
+    """Checks whether an error of a call to Google API is worth retrying"""
+    from googleapiclient.errors import HttpError
+
+    if isinstance(error, HttpError):
+        return is_rate_limited(error) or error.resp.status in RETRIABLE_STATUSES
+
+    return isinstance(error, TRANSIENT_ERRORS)
 
 
-def synchronize_wps(parsed_wps, parsed_events, service, calendar_id):
+def is_rate_limited(error):
+    """Checks whether an error is due to the quota of Google API"""
+    from googleapiclient.errors import HttpError
+
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    if error.resp.status != 403:
+        return False
+    try:
+        reasons = [elem['reason'] for elem in
+                   json.loads(error.content.decode('utf-8'))['error']['errors']]
+    except Exception:  # Not a json error body, i.e. not a quota error
+        return False
+
+    return any(reason in RATE_LIMIT_REASONS for reason in reasons)
+
+
+class RateLimiter:
+    """Token bucket that limits the rate of calls to Google APIs.
+
+    Tokens are added with `rate` tokens per second up to `burst` tokens, and
+    each call takes one. Calendar API allows about 10 calls per second per
+    user by default, thus the rate should stay below it. If Google still
+    reports that the quota is exceeded, the rate is halved by `slow_down()`.
+    Then, it recovers by `increase` calls per second every second that
+    passes without another slow down, however many calls are made.
+
+    Args:
+        rate: allowed number of calls per second
+        burst: number of calls that can be made at once after an idle period
+        increase: calls per second added to a slowed down rate each second,
+            by default the rate recovers from half in 15 seconds
+    """
+
+    def __init__(self, rate, burst=None, increase=None):
+        self.max_rate = float(rate)
+        self.rate = self.max_rate
+        self.burst = burst or max(1, int(rate))
+        self.increase = increase or self.max_rate / 30
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._slowed_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def acquire(self, count=1):
+        """Blocks until `count` calls are allowed, e.g. the calls of a batch.
+
+        Calls beyond `burst` are taken in advance, the next calls wait for
+        them.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(count, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= count
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def batch_size(self, limit):
+        """Returns how many of `limit` calls can be sent at once in a batch"""
+        with self._lock:
+            self._refill()
+            return max(1, min(limit, self.burst, int(self.rate)))
+
+    def slow_down(self):
+        """Halves the rate, down to one call in ten seconds at the lowest.
+
+        Concurrent calls usually hit the limit together, thus the rate is
+        halved at most once per second.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._slowed_at < 1:
+                return
+            self._refill()
+            self._slowed_at = now
+            self.rate = max(0.1, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+
+    def _refill(self):
+        """Adds the tokens and the recovery of the rate since the last call"""
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self.rate = min(self.max_rate, self.rate + elapsed * self.increase)
+
+
+def execute_concurrently(operations, max_workers, limiter=None, max_retries=0,
+                         metrics=None):
+    """Executes operations on a pool of threads.
+
+    Requests of the services built by this module can be executed from any
+    thread, see transport.PooledHttp.
+
+    Args:
+        operations: a list of operations, None elements are skipped
+        max_workers: number of operations executed at the same time
+        limiter: optional RateLimiter shared by all threads
+        max_retries: number of retries if a call fails temporarily
+        metrics: optional instrumentation.RunMetrics that counts retries
+
+    Returns:
+        errors: str(error) or None for each operation, in the same order
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda operation: execute_operation(operation, limiter, max_retries,
+                                                metrics=metrics),
+            operations))
+
+
+def execute_in_batches(operations, service, batch_size=MAX_BATCH_SIZE,
+                       limiter=None, max_retries=0, metrics=None):
+    """Executes operations in Google API batch requests.
+
+    Each batch groups up to `batch_size` requests into a single HTTP round
+    trip. Google allows at most 50 calls in a batch. Responses are delivered
+    to a callback per request, which reports the success or saves the error
+    at the position of the operation. Requests that failed temporarily, e.g.
+    due to rate limits, are sent again in later batches after a backoff, and
+    so are all requests of a batch that failed as a whole temporarily, e.g.
+    due to a dropped connection.
+
+    If a `limiter` is given, a batch takes a token for each of its requests
+    before it is sent, and it has at most as many requests as the limiter
+    allows in a second. Thus, batches get smaller when Google reports that
+    the quota is exceeded, and retries do not arrive as a single burst.
+
+    Args:
+        operations: a list of operations, None elements are skipped
+        service: Google API service built with Calendar scope
+        batch_size: maximum number of requests in one batch
+        limiter: optional RateLimiter that paces the batches
+        max_retries: number of retries if a call fails temporarily
+        metrics: optional instrumentation.RunMetrics that counts retried
+            requests, each of them once
+
+    Returns:
+        errors: str(error) or None for each operation, in the same order
+    """
+    errors = [None] * len(operations)
+    pending = [index for index, operation in enumerate(operations)
+               if operation is not None]
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    retry, retried, done = set(), set(), set()
+
+    def callback(request_id, response, exception):
+        index = int(request_id)
+        if exception is not None:
+            try:
+                idempotent = idempotent_response(operations[index][0], exception)
+            except Exception as error:  # Update of a conflicting insert failed
+                idempotent, exception = None, error
+            if idempotent is not None:
+                response, exception = idempotent, None
+        if exception is None:
+            errors[index] = None
+            done.add(index)
+            operations[index][1](response)
+            return
+        errors[index] = str(exception)
+        if is_transient(exception):
+            retry.add(index)
+            if limiter is not None and is_rate_limited(exception):
+                limiter.slow_down()
+
+    for attempt in range(max_retries + 1):
+        start = 0
+        while start < len(pending):
+            size = batch_size if limiter is None else limiter.batch_size(batch_size)
+            indexes = pending[start:start + size]
+            start += size
+            if limiter is not None:
+                limiter.acquire(len(indexes))
+            batch = service.new_batch_http_request(callback=callback)
+            for index in indexes:
+                batch.add(operations[index][0], request_id=str(index))
+            try:
+                batch.execute()
+            except Exception as error:  # The batch has failed as a whole
+                failed = [index for index in indexes if index not in done]
+                for index in failed:
+                    errors[index] = str(error)
+                if is_transient(error):
+                    retry.update(failed)
+                    if limiter is not None and is_rate_limited(error):
+                        limiter.slow_down()
+        if not retry or attempt == max_retries:
+            break
+        pending, retry = sorted(retry), set()
+        retried.update(pending)
+        time.sleep(random.uniform(0, min(32, 2 ** attempt)))
+    if metrics is not None and retried:
+        metrics.record_retry('calendar', len(retried))
+
+    return errors
+
+
+def synchronize_wps(parsed_wps, parsed_events, service, calendar_id,
+                    batch_size=None, max_workers=None, limiter=None,
+                    max_retries=0, store=None, metrics=None, window=None,
+                    journal=None):
     """Synchronizes OpenProject work pacakges with Google Calendar events
 
     After loading and parsing all work packages and events, this function is
     called to synchronize events on Google Calendar. For each work package
     there are three possible actions: (i) It should be created, (ii) It is
     already created but its content requires an update, and (iii) work package is
-    closed or deleted, so it should be removed from the calendar.
+    closed or deleted, so it should be removed from the calendar. Events that
+    are as synchronized from their work packages are not compared, see
+    is_synchronized().
 
     Args:
-        parsed_wps: a dictionary of structured workpackages. Key is wp ID.
-        parsed_events: a dictionary of structured events. Key is wp ID.
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
+        parsed_events: a dictionary of records.EventRecord. Key is wp ID.
         service: Authorized Google Calendar API service
         calendar_id: Id of the Calendar which workpackages are synchronized.
+        batch_size: if given, calls are grouped into batches of this size.
+            Otherwise, each call is executed on its own.
+        max_workers: if given, calls are executed concurrently on this many
+            threads. Ignored if `batch_size` is given.
+        limiter: optional RateLimiter that paces the calls
+        max_retries: number of retries if a call fails temporarily
+        store: if given, the index of events kept in this
+            state_store.StateStore is updated with successful calls
+        metrics: optional instrumentation.RunMetrics that counts calls
+            of each action and their retries
+        window: if work packages are read within a window, (start, end) as
+            returned from time_window(). Events outside of it are not
+            deleted, since their work packages are not read.
+        journal: if given, operations are written to the journal kept in
+            this state_store.StateStore before they are executed and marked
+            complete after, so that replay_journal() can finish them if the
+            process dies in the middle
 
     Returns:
         wp_ids: classified wp_ids as create, delete or update
@@ -403,23 +1679,47 @@ def synchronize_wps(parsed_wps, parsed_events, service, calendar_id):
     wps_on_calendar = set(parsed_events.keys())
     # Decide which packages to create, to delete and may update
     to_create_set = wps_on_openproject.difference(wps_on_calendar)
-    to_delete_set = wps_on_calendar.difference(wps_on_openproject)
-    may_update_set = wps_on_calendar.intersection(wps_on_openproject)
-    to_create_err, to_delete_err, may_update_err = [], [], []
-
-    # Iterate over each work_package
-    for wp_id in to_create_set:
-        err = to_create(parsed_wps[wp_id], service, calendar_id)
-        to_create_err.append(err)
-
-    for wp_id in to_delete_set:
-        err = to_delete(parsed_events[wp_id], service, calendar_id)
-        to_delete_err.append(err)
-
-    for wp_id in may_update_set:
-        work_package, event = parsed_wps[wp_id], parsed_events[wp_id]
-        err = may_update(work_package, event, service, calendar_id)
-        may_update_err.append(err)
+    to_delete_set = {wp_id for wp_id in wps_on_calendar.difference(wps_on_openproject)
+                     if in_window(parsed_events[wp_id], window)}
+    may_update_set = {wp_id for wp_id in wps_on_calendar.intersection(wps_on_openproject)
+                      if not is_synchronized(parsed_wps[wp_id], parsed_events[wp_id])}
+
+    # Prepare the calls for each work_package
+    to_create_ops = [create_operation(parsed_wps[wp_id], service, calendar_id)
+                     for wp_id in to_create_set]
+    to_delete_ops = [delete_operation(parsed_events[wp_id], service, calendar_id)
+                     for wp_id in to_delete_set]
+    may_update_ops = [update_operation(parsed_wps[wp_id], parsed_events[wp_id],
+                                       service, calendar_id)
+                      for wp_id in may_update_set]
+
+    operations = to_create_ops + to_delete_ops + may_update_ops
+    actions = ['create'] * len(to_create_ops) + ['delete'] * len(to_delete_ops) \
+        + ['update'] * len(may_update_ops)
+    wp_order = list(to_create_set) + list(to_delete_set) + list(may_update_set)
+    if journal is not None:
+        operations = journal_operations(operations, actions, wp_order, parsed_wps,
+                                        parsed_events, journal, calendar_id)
+    results = []  # Successful calls to update the index of events
+    if store is not None:
+        operations = [record_result(operation, action, wp_id, results)
+                      for operation, action, wp_id in zip(operations, actions, wp_order)]
+    errors = execute_operations(operations, service, batch_size, max_workers,
+                                limiter, max_retries, metrics)
+    # Split errors back into the phases they occured
+    to_create_err = errors[:len(to_create_ops)]
+    to_delete_err = errors[len(to_create_ops):len(to_create_ops) + len(to_delete_ops)]
+    may_update_err = errors[len(to_create_ops) + len(to_delete_ops):]
+    if store is not None:
+        update_index(store, calendar_id, parsed_wps, results)
+    if journal is not None:  # Failed operations are planned again next run
+        journal.clear_journal(calendar_id)
+    if metrics is not None:
+        for action, ops, errs in (('create', to_create_ops, to_create_err),
+                                  ('delete', to_delete_ops, to_delete_err),
+                                  ('update', may_update_ops, may_update_err)):
+            metrics.record_actions(action, sum(op is not None for op in ops),
+                                   sum(err is not None for err in errs))
 
     wp_ids = [to_create_set, to_delete_set, may_update_set]
     error = [to_create_err, to_delete_err, may_update_err]
@@ -427,7 +1727,202 @@ def synchronize_wps(parsed_wps, parsed_events, service, calendar_id):
     return [wp_ids, error]
 
 
-def save_logs(wps, errors, sheet_service, sheet_id):
+def is_synchronized(work_package, parsed_event):
+    """Checks whether an event is as synchronized from its work package.
+
+    The event is as synchronized if it has not changed since the last
+    synchronization, see parse_events(), and the work package has not been
+    updated since, i.e. its `updated_at` is the one saved with the event.
+    Such work packages are skipped without building their events, which is
+    the bulk of the work of a run for large projects.
+    """
+    return parsed_event.updated_at is not None \
+        and parsed_event.updated_at == work_package.updated_at
+
+
+def in_window(parsed_event, window):
+    """Checks whether an event is in the window of synchronization.
+
+    Events end an hour after the due time of their work packages, thus an
+    event that ends on the first day of the window may belong to a work
+    package due on the day before. Such events and events with an unknown
+    date are considered outside of the window.
+
+    Args:
+        parsed_event: a records.EventRecord
+        window: (start, end) as returned from time_window(), or None if
+            everything is synchronized
+
+    Returns:
+        True if the event is in the window, False otherwise
+    """
+    if window is None:
+        return True
+    if not parsed_event.due_date:
+        return False
+    start, end = window
+
+    return start.date().isoformat() < parsed_event.due_date \
+        <= (end - timedelta(days=1)).date().isoformat()
+
+
+def execute_operations(operations, service, batch_size=None, max_workers=None,
+                       limiter=None, max_retries=0, metrics=None):
+    """Executes operations in batches, concurrently or one by one.
+
+    Args:
+        operations: a list of operations, None elements are skipped
+        service: Google API service built with Calendar scope
+        batch_size: if given, calls are grouped into batches of this size
+        max_workers: if given, calls are executed concurrently on this many
+            threads. Ignored if `batch_size` is given.
+        limiter: optional RateLimiter that paces the calls
+        max_retries: number of retries if a call fails temporarily
+        metrics: optional instrumentation.RunMetrics that counts retries
+
+    Returns:
+        errors: str(error) or None for each operation, in the same order
+    """
+    if batch_size:
+        return execute_in_batches(operations, service, batch_size, limiter,
+                                  max_retries, metrics)
+    if max_workers:
+        return execute_concurrently(operations, max_workers, limiter,
+                                    max_retries, metrics)
+
+    return [execute_operation(operation, limiter, max_retries, metrics=metrics)
+            for operation in operations]
+
+
+def journal_operations(operations, actions, wp_ids, parsed_wps, parsed_events,
+                       journal, calendar_id):
+    """Writes operations to the journal before they are executed.
+
+    All operations are written in a single transaction. The report of each
+    operation is wrapped to mark the operation complete with its response,
+    which is what the index of events is updated from.
+
+    Args:
+        operations: a list of operations, None elements are skipped
+        actions: 'create', 'delete' or 'update' for each operation
+        wp_ids: ID of the work package of each operation
+        parsed_wps: a dictionary of records.WorkPackageRecord. Key is wp ID.
+        parsed_events: a dictionary of records.EventRecord. Key is wp ID.
+        journal: state_store.StateStore where the journal is kept
+        calendar_id: Calendar ID of Google Calendar
+
+    Returns:
+        operations: the operations whose completion is journaled
+    """
+    entries, journaled = [], []
+    for operation, action, wp_id in zip(operations, actions, wp_ids):
+        if operation is None:
+            journaled.append(None)
+            continue
+        request, report = operation
+        source = parsed_events[wp_id] if action == 'delete' else parsed_wps[wp_id]
+        entries.append({'wp_id': wp_id,
+                        'action': action,
+                        'event_id': None if action == 'create'
+                                    else parsed_events[wp_id].event_id,
+                        'body': request.body,
+                        'subject': source.subject,
+                        'updated_at': source.updated_at})
+        journaled.append((request, completing_report(report, journal,
+                                                     calendar_id, wp_id)))
+    journal.write_journal(calendar_id, entries)
+
+    return journaled
+
+
+def completing_report(report, journal, calendar_id, wp_id):
+    """Wraps the report of an operation to mark it complete in the journal"""
+    def complete_and_report(response):
+        journal.complete_journal(calendar_id, wp_id, response)
+        report(response)
+
+    return complete_and_report
+
+
+def replay_journal(service, calendar_id, journal, store=None, batch_size=None,
+                   max_workers=None, limiter=None, max_retries=0, metrics=None):
+    """Finishes the operations left in the journal by an interrupted run.
+
+    Operations that have not completed are executed again. Insertions carry
+    the ids of their events and deletions of deleted events succeed, see
+    idempotent_response(), thus an operation that actually succeeded before
+    the interruption is not done twice. Then, completed operations are
+    saved to the index of events and the journal is cleared. It should be
+    called before the events are read.
+
+    Args:
+        service: Google API service built with Calendar scope
+        calendar_id: Calendar ID of Google Calendar
+        journal: state_store.StateStore where the journal is kept
+        store: if given, the index of events kept in this
+            state_store.StateStore is updated with completed operations
+        batch_size: if given, calls are grouped into batches of this size
+        max_workers: if given, calls are executed concurrently
+        limiter: optional RateLimiter that paces the calls
+        max_retries: number of retries if a call fails temporarily
+        metrics: optional instrumentation.RunMetrics that counts retries
+
+    Returns:
+        wp_ids: wp_ids of the operations executed again
+        err: Faced errors during the operations executed again
+    """
+    entries = [JournalEntry(**entry) for entry in journal.load_journal(calendar_id)]
+    results = [(entry.action, entry.wp_id, entry.response) for entry in entries
+               if entry.response is not None]  # Completed before interruption
+    unfinished = [entry for entry in entries if entry.response is None]
+    operations = [record_result(journaled_operation(entry, service, calendar_id),
+                                entry.action, entry.wp_id, results)
+                  for entry in unfinished]
+    errors = execute_operations(operations, service, batch_size, max_workers,
+                                limiter, max_retries, metrics)
+    if store is not None:
+        update_index(store, calendar_id, {entry.wp_id: entry for entry in entries},
+                     results)
+    journal.clear_journal(calendar_id)
+
+    return [entry.wp_id for entry in unfinished], errors
+
+
+def journaled_operation(entry, service, calendar_id):
+    """Returns the operation of a records.JournalEntry to execute it again"""
+    events = service.events()
+    if entry.action == 'create':
+        event = json_loads(entry.body)
+        request = events.insert(calendarId=calendar_id, body=event, fields=EVENT_FIELDS)
+        request.on_conflict = conflict_update(service, calendar_id, event)
+    elif entry.action == 'delete':
+        request = events.delete(calendarId=calendar_id, eventId=entry.event_id)
+    else:
+        request = events.patch(calendarId=calendar_id, eventId=entry.event_id,
+                               body=json_loads(entry.body), fields=EVENT_FIELDS)
+
+    def report(response):
+        print('Interrupted {} of work package {} has been completed'.format(
+            entry.action, entry.wp_id))
+
+    return request, report
+
+
+def record_result(operation, action, wp_id, results):
+    """Wraps the report of an operation to append its result to `results`"""
+    if operation is None:
+        return None
+
+    request, report = operation
+
+    def report_and_record(response):
+        report(response)
+        results.append((action, wp_id, response))  # Thread-safe
+
+    return request, report_and_record
+
+
+def save_logs(wps, errors, sheet_service, sheet_id, label=None):
     """Saves work package and error logs and to a Google Sheet.
 
     Action and error logs are saved to a Google Sheet since this code will be
@@ -439,9 +1934,32 @@ def save_logs(wps, errors, sheet_service, sheet_id):
         errors: raised errors from calendar operations. If no error Nonetype
         sheet_service: Authorized Google Sheet API service
         sheet_id: Id of the sheet in which logs are saved.
+        label: optional, written next to the log time, e.g. project name
+    """
+    log_time = [datetime.now().isoformat()]
+    if label is not None:
+        log_time.append(label)
+
+    for range_name, values in log_rows(wps, errors, log_time).items():
+        data = {'values': values}
+        # Append into errors and actions pages of sheet
+        sheet_service.spreadsheets().values().append(spreadsheetId=sheet_id,
+                                                     valueInputOption='USER_ENTERED',
+                                                     range=range_name,
+                                                     body=data).execute()
+
+
+def log_rows(wps, errors, log_time):
+    """Returns the rows of error and action logs of a synchronization.
+
+    Args:
+        wps: classified wp_ids as create, delete or update
+        errors: raised errors from calendar operations. If no error Nonetype
+        log_time: first row of the logs, log time and optional label
+
+    Returns:
+        rows: a dictionary of rows to append, key is the page of the sheet
     """
-    # Error logs
-    range_name = 'errors'
     # Parse errors and insert where the error occured
     to_create_errors = [str(elem) for elem in errors[0]]
     to_create_errors.insert(0, 'to_create_errors')
@@ -452,18 +1970,7 @@ def save_logs(wps, errors, sheet_service, sheet_id):
     may_update_errors = [str(elem) for elem in errors[2]]
     may_update_errors.insert(0, 'may_update_errors')
 
-    log_time = [datetime.now().isoformat()]
-    values = [log_time, to_create_errors, to_delete_errors, may_update_errors]
-    data = {'values': values}
-
-    # Append into errors page of sheet
-    sheet_service.spreadsheets().values().append(spreadsheetId=sheet_id,
-                                                 valueInputOption='USER_ENTERED',
-                                                 range=range_name,
-                                                 body=data).execute()
-
     # Parse actions and insert where the action has taken
-    range_name = 'actions'
     to_create = [str(elem) for elem in wps[0]]
     to_create.insert(0, 'to_create')
 
@@ -473,11 +1980,5 @@ def save_logs(wps, errors, sheet_service, sheet_id):
     may_update = [str(elem) for elem in wps[2]]
     may_update.insert(0, 'may_update')
 
-    values = [log_time, to_create, to_delete, may_update]
-    data = {'values': values,}
-
-    # Append into actions page of sheet
-    sheet_service.spreadsheets().values().append(spreadsheetId=sheet_id,
-                                                 valueInputOption='USER_ENTERED',
-                                                 range=range_name,
-                                                 body=data).execute()
+    return {'errors': [log_time, to_create_errors, to_delete_errors, may_update_errors],
+            'actions': [log_time, to_create, to_delete, may_update]}
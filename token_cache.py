@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of the access tokens of Google service account credentials.
+
+Access tokens last 60 minutes, but credentials are created by each run and
+the first call of each run exchanges the key of the service account for a
+new token. When runs are scheduled every 10 minutes, five of six tokens are
+thrown away while they are still valid. Instead, tokens are kept in a file
+that only its owner can read and write (0600), keyed by the service account
+and the scopes. A run reuses the cached token while it is valid, and one
+that finds it about to expire refreshes it and saves the new one. Several
+processes may use the same file: the file is replaced atomically, thus
+readers never see a half-written one, and refreshes are serialized with a
+lock file, thus only one process exchanges the key when the token expires.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+try:  # File locks of POSIX systems
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class TokenCache:
+    """Access tokens of credentials kept in a file between runs.
+
+    The file is a json object whose keys are the service account and the
+    scopes of each credentials, and whose values are their `token` and its
+    `expiry` in UTC. On Windows, the file is not restricted by permissions,
+    it should be kept in a private directory.
+
+    Args:
+        path: path to the cache file, created when a token is saved
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, credentials, margin=300):
+        """Sets the cached token to credentials if it is valid for `margin` seconds.
+
+        Returns:
+            True if a valid token is found, False otherwise
+        """
+        entry = self._read().get(cache_key(credentials))
+        if entry is None:
+            return False
+        expiry = datetime.fromisoformat(entry['expiry'])
+        if expiry - datetime.utcnow() < timedelta(seconds=margin):
+            return False
+        credentials.token = entry['token']
+        credentials.expiry = expiry
+
+        return True
+
+    def refresh(self, credentials, margin=300):
+        """Makes sure credentials have a token valid for `margin` seconds.
+
+        The token of the credentials, or the cached one, is used if it is
+        still valid. Otherwise, the token is refreshed and saved. If another
+        process refreshes it at the same time, its token is used instead.
+
+        Args:
+            credentials: google.oauth2.service_account.Credentials object
+            margin: seconds before expiry to refresh the token
+        """
+        from google.auth.transport.requests import Request
+
+        if is_valid(credentials, margin) or self.load(credentials, margin):
+            return
+        with self._locked():
+            if self.load(credentials, margin):  # Refreshed by another process
+                return
+            credentials.refresh(Request())
+            self._save(credentials)
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):  # No cache yet, or it is broken
+            return {}
+
+    def _save(self, credentials):
+        """Saves the token of credentials, must be called with the lock held"""
+        entries = self._read()
+        now = datetime.utcnow()
+        entries = {key: entry for key, entry in entries.items()  # Drop expired
+                   if datetime.fromisoformat(entry['expiry']) > now}
+        entries[cache_key(credentials)] = {'token': credentials.token,
+                                           'expiry': credentials.expiry.isoformat()}
+        temporary_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(private_file(temporary_path, os.O_WRONLY | os.O_TRUNC), 'w',
+                  encoding='utf-8') as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(temporary_path, self.path)
+
+    @contextmanager
+    def _locked(self):
+        """Holds the lock of the cache against other processes in the context"""
+        with open(private_file(self.path + '.lock', os.O_RDWR), 'r+') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def cache_key(credentials):
+    """Returns the key of credentials in the cache, the account and scopes"""
+    return '{} {}'.format(getattr(credentials, 'service_account_email', ''),
+                          ' '.join(sorted(getattr(credentials, 'scopes', None) or [])))
+
+
+def is_valid(credentials, margin=300):
+    """Checks whether credentials have a token valid for `margin` seconds"""
+    return credentials.token is not None and credentials.expiry is not None and \
+        credentials.expiry - datetime.utcnow() >= timedelta(seconds=margin)
+
+
+def private_file(path, flags):
+    """Opens a file that only its owner can read and write, creates if missing.
+
+    Returns:
+        descriptor: file descriptor to pass to open()
+    """
+    descriptor = os.open(path, flags | os.O_CREAT, 0o600)
+    if hasattr(os, 'fchmod'):  # The file might be created earlier by others
+        os.fchmod(descriptor, 0o600)
+
+    return descriptor
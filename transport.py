@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Transport of Google API services shared by the threads of synchronization.
+
+Google API services execute their requests on an `httplib2` transport by
+default, which is neither thread-safe nor pooled: each thread needs its own
+transport and each transport opens its own connections. Instead, services
+built by `synchronization` share one PooledHttp, an authorized `requests`
+session with a pool of keep-alive connections that any thread can use. Thus,
+concurrent calls, batches and both Calendar and Sheets services reuse the
+same TLS connections. The transport may report each request to an observer,
+e.g. to count requests and transferred bytes. Responses are parsed with the
+fastest json parser installed, see FastJsonModel. This module is imported
+only when a service is built, since Google API client libraries are slow to
+import.
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import threading
+import httplib2
+import requests
+from google.auth.transport.requests import AuthorizedSession, Request
+from googleapiclient.model import JsonModel
+from synchronization import json_loads
+
+
+class PooledHttp:
+    """Thread-safe authorized transport on a pool of keep-alive connections.
+
+    Google API services call `request()` as they call `httplib2.Http`, and
+    receive an `httplib2.Response` and the content. Requests are sent on an
+    `AuthorizedSession`, which adds the access token and refreshes it when
+    it expires. Refreshes are serialized, thus threads that find the token
+    expired at the same time refresh it once. Credentials are not exposed
+    as `credentials`, otherwise the client library would refresh them
+    itself before each batch, and would authorize each request in a batch
+    although the batch request is authorized for all of them.
+
+    Google compresses responses only if the user agent contains "gzip".
+    Requests of services do so, but batch requests do not. Thus, each
+    request is marked to accept gzip.
+
+    Args:
+        credentials: credentials that authorize requests
+        pool_size: maximum number of connections kept open to each host,
+            should not be less than the number of concurrent calls
+        timeout: seconds to wait for connecting and for each read
+        observer: optional, called with uri, method, body, response and
+            content of each request
+    """
+
+    def __init__(self, credentials, pool_size=10, timeout=60, observer=None):
+        self._credentials = credentials
+        self.timeout = timeout
+        self.observer = observer
+        self.session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._auth_request = Request()
+        self._refresh_lock = threading.Lock()
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        headers = dict(headers or {})
+        headers.setdefault('accept-encoding', 'gzip, deflate')
+        if 'gzip' not in headers.get('user-agent', ''):
+            headers['user-agent'] = (headers.get('user-agent', '') + ' (gzip)').strip()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not self._credentials.valid:
+            with self._refresh_lock:
+                if not self._credentials.valid:  # Not refreshed by another thread
+                    self._credentials.refresh(self._auth_request)
+        reply = self.session.request(method, uri, data=body, headers=headers,
+                                     timeout=self.timeout,
+                                     allow_redirects=redirections > 0)
+        info = {key.lower(): value for key, value in reply.headers.items()}
+        if 'content-encoding' in info:  # Content is decoded, as httplib2 does
+            info['-content-encoding'] = info.pop('content-encoding')
+        info['status'] = str(reply.status_code)
+        response = httplib2.Response(info)
+        response.reason = reply.reason
+        content = reply.content
+        if self.observer is not None:
+            self.observer(uri, method, body, response, content)
+
+        return response, content
+
+    def close(self):
+        """Closes the connections of the pool"""
+        self.session.close()
+
+
+class FastJsonModel(JsonModel):
+    """Json model of Google API services that parses with json_loads.
+
+    `json_loads` of synchronization is orjson or ujson if one of them is
+    installed, and parses bytes without decoding them first.
+    """
+
+    def deserialize(self, content):
+        try:
+            body = json_loads(content)
+        except ValueError:  # Not json, returned as it is
+            return content
+        if self._data_wrapper and 'data' in body:
+            body = body['data']
+
+        return body
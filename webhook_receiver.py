@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Receiver of OpenProject webhooks that queues changed work packages.
+
+Polling OpenProject every few minutes shows changes late, and most polls
+find nothing to do. Instead, OpenProject can call a webhook whenever a work
+package is created or updated. WebhookReceiver serves such webhooks on a
+local HTTP server and puts the ids of changed work packages on a
+ChangeQueue. A burst of edits, e.g. a work package that is saved several
+times in a row or a bulk edit, calls the webhook many times. The queue
+keeps each work package once and hands changes out only after no new ones
+have arrived for a while, so that a burst is synchronized at once, see
+main.daemon().
+
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+%% Google Calendar Task Synchronization Script for Open Project
+%% -------------------
+%% $Author: Halil Said Cankurtaran$,
+%% $Date: January 10th, 2020$,
+%% $Revision: 1.0$
+%% $Tapir Lab.$
+%% $Copyright: Tapir Lab.$
+%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACTIONS = ('work_package:created', 'work_package:updated')
+
+
+class ChangeQueue:
+    """Debounced queue of changed work packages, each of them kept once.
+
+    Args:
+        debounce: changes are handed out when none has arrived for this
+            many seconds
+        max_delay: changes are handed out at the latest this many seconds
+            after the first of them, even if new ones keep arriving
+    """
+
+    def __init__(self, debounce=5.0, max_delay=60.0):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._changes = {}
+        self._first_at = None
+        self._last_at = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, project_id, wp_id):
+        """Queues a changed work package of a project, None if it is unknown"""
+        with self._condition:
+            now = time.monotonic()
+            if not self._changes:
+                self._first_at = now
+            self._last_at = now
+            self._changes.setdefault(project_id, set()).add(wp_id)
+            self._condition.notify_all()
+
+    def take(self, timeout=None):
+        """Waits for settled changes and removes them from the queue.
+
+        Args:
+            timeout: seconds to wait at most, waits until the queue is
+                closed if None
+
+        Returns:
+            changes: a dictionary of sets of wp IDs, keys are project IDs.
+                It is empty if the timeout expires or the queue is closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while not self._closed:
+                now = time.monotonic()
+                if self._changes:
+                    ready_at = min(self._last_at + self.debounce,
+                                   self._first_at + self.max_delay)
+                    if now >= ready_at:
+                        changes, self._changes = self._changes, {}
+                        return changes
+                    wake_at = ready_at if deadline is None else min(ready_at, deadline)
+                else:
+                    wake_at = deadline
+                if wake_at is not None and now >= wake_at:
+                    break
+                self._condition.wait(None if wake_at is None else wake_at - now)
+
+        return {}
+
+    def close(self):
+        """Wakes up the waiting take() calls, they return nothing"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class WebhookReceiver:
+    """HTTP server that receives webhooks of work packages from OpenProject.
+
+    Each `work_package:created` or `work_package:updated` webhook puts the
+    id of the work package and of its project on the queue. Other webhooks
+    are accepted and ignored. If a `secret` is given, webhooks whose
+    `X-OP-Signature` header is not the HMAC-SHA1 of their body with the
+    secret are rejected with 401, and webhooks of work packages that are
+    not well formed with 400. Requests are answered at once, the work
+    packages are synchronized later.
+
+    Args:
+        queue: ChangeQueue where changed work packages are put
+        host: address to listen on
+        port: port to listen on, a free one is chosen if it is 0
+        secret: optional, secret of the webhook configured on OpenProject
+        path: path of the webhook
+    """
+
+    def __init__(self, queue, host='127.0.0.1', port=0, secret=None, path='/'):
+        self.queue = queue
+        self.secret = secret
+        self.path = path
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}{}'.format(host, port, self.path)
+
+    def start(self):
+        """Serves webhooks on a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        name='webhook-receiver', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """Stops serving webhooks and closes the server"""
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def receive(self, body, signature=None):
+        """Queues the work package of a webhook body.
+
+        Returns:
+            status: HTTP status of the answer
+        """
+        if self.secret is not None:
+            expected = 'sha1=' + hmac.new(self.secret.encode('utf-8'), body,
+                                          hashlib.sha1).hexdigest()
+            if signature is None or not hmac.compare_digest(signature, expected):
+                return 401
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(payload, dict) or payload.get('action') not in ACTIONS:
+            return 200
+        work_package = payload.get('work_package')
+        if not isinstance(work_package, dict) or \
+                not isinstance(work_package.get('id'), int):
+            return 400
+        try:
+            project_id = project_of(work_package)
+        except ValueError:
+            return 400
+        self.queue.put(project_id, work_package['id'])
+
+        return 200
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.partition('?')[0] != receiver.path:
+                    status = 404
+                else:
+                    try:
+                        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                        status = receiver.receive(body,
+                                                  self.headers.get('X-OP-Signature'))
+                    except ValueError:  # Content-Length is not a number
+                        status = 400
+                    except Exception as error:  # Answer even if it fails
+                        print('Webhook could not be received: %r' % error)
+                        status = 500
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):  # Quiet, webhooks are frequent
+                pass
+
+        return Handler
+
+
+def project_of(work_package):
+    """Returns the project ID of a work package representation, else None.
+
+    Raises:
+        ValueError: if the links of the work package are not well formed
+    """
+    links = work_package.get('_links') or {}
+    project = links.get('project') or {} if isinstance(links, dict) else None
+    if not isinstance(project, dict) or \
+            not isinstance(project.get('href') or '', str):
+        raise ValueError('Links of work package {} are not well formed'.format(
+            work_package.get('id')))
+    project_id = (project.get('href') or '').rstrip('/').rpartition('/')[2]
+
+    return int(project_id) if project_id.isdigit() else None
+
+
+def is_loopback(host):
+    """Checks whether an address to listen on is reachable only from this host"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:  # A host name, or '' for all interfaces
+        return False